@@ -0,0 +1,28 @@
+"""Add owner_id, id index to notes table
+
+Revision ID: 3a1c15c226bc
+Revises: 42bbb36ade03
+Create Date: 2026-10-18 09:12:40.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3a1c15c226bc'
+down_revision: Union[str, Sequence[str], None] = '42bbb36ade03'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_notes_owner_id_id', 'notes', ['owner_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_notes_owner_id_id', table_name='notes')
@@ -0,0 +1,57 @@
+"""Add note jobs and word count
+
+Revision ID: 7f3a9c2d5e18
+Revises: e1b4f08a6c27
+Create Date: 2026-10-18 17:41:52.906114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7f3a9c2d5e18'
+down_revision: Union[str, Sequence[str], None] = 'e1b4f08a6c27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _replace_fts_update_trigger(columns: str) -> None:
+    op.execute("DROP TRIGGER IF EXISTS notes_fts_au")
+    op.execute(
+        f"CREATE TRIGGER notes_fts_au AFTER UPDATE{columns} ON notes BEGIN "
+        "INSERT INTO notes_fts(notes_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content); "
+        "INSERT INTO notes_fts(rowid, title, content) VALUES (new.id, new.title, new.content); END"
+    )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('note_jobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=50), nullable=False),
+    sa.Column('note_id', sa.Integer(), nullable=True),
+    sa.Column('owner_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=16), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('run_after', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    sa.Column('last_error', sa.String(), nullable=True),
+    sa.ForeignKeyConstraint(['owner_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_note_jobs_status_run_after', 'note_jobs', ['status', 'run_after'], unique=False)
+    op.add_column('notes', sa.Column('word_count', sa.Integer(), nullable=True))
+    if op.get_bind().dialect.name == 'sqlite':
+        # Only reindex when an indexed column changes, not when a job fills in word_count.
+        _replace_fts_update_trigger(" OF title, content")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == 'sqlite':
+        _replace_fts_update_trigger("")
+    op.drop_column('notes', 'word_count')
+    op.drop_index('ix_note_jobs_status_run_after', table_name='note_jobs')
+    op.drop_table('note_jobs')
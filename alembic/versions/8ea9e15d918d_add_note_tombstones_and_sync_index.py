@@ -0,0 +1,65 @@
+"""Add note tombstones and sync index
+
+Revision ID: 8ea9e15d918d
+Revises: 94fe54dd34f0
+Create Date: 2026-10-18 11:26:14.730581
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8ea9e15d918d'
+down_revision: Union[str, Sequence[str], None] = '94fe54dd34f0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Rebuilding notes on SQLite drops its full-text triggers from 94fe54dd34f0.
+SQLITE_FTS_TRIGGERS = (
+    "CREATE TRIGGER notes_fts_ai AFTER INSERT ON notes BEGIN "
+    "INSERT INTO notes_fts(rowid, title, content) VALUES (new.id, new.title, new.content); END",
+    "CREATE TRIGGER notes_fts_ad AFTER DELETE ON notes BEGIN "
+    "INSERT INTO notes_fts(notes_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content); END",
+    "CREATE TRIGGER notes_fts_au AFTER UPDATE ON notes BEGIN "
+    "INSERT INTO notes_fts(notes_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content); "
+    "INSERT INTO notes_fts(rowid, title, content) VALUES (new.id, new.title, new.content); END",
+)
+
+
+def set_sqlite_autoincrement(enabled: bool) -> None:
+    """AUTOINCREMENT can only be set by rebuilding the table."""
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    with op.batch_alter_table('notes', recreate='always', table_kwargs={'sqlite_autoincrement': enabled}):
+        pass
+    for trigger in SQLITE_FTS_TRIGGERS:
+        op.execute(trigger)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('note_tombstones',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('note_id', sa.Integer(), nullable=False),
+    sa.Column('owner_id', sa.Integer(), nullable=False),
+    sa.Column('deleted_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    sa.ForeignKeyConstraint(['owner_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_note_tombstones_owner_id_deleted_at', 'note_tombstones', ['owner_id', 'deleted_at'], unique=False)
+    # Notes now get updated_at on insert; backfill older rows so they sort into sync order.
+    op.execute("UPDATE notes SET updated_at = created_at WHERE updated_at IS NULL")
+    op.create_index('ix_notes_owner_id_updated_at', 'notes', ['owner_id', 'updated_at'], unique=False)
+    # Never reuse ids of deleted notes; sync clients identify tombstones by id.
+    set_sqlite_autoincrement(True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    set_sqlite_autoincrement(False)
+    op.drop_index('ix_notes_owner_id_updated_at', table_name='notes')
+    op.drop_index('ix_note_tombstones_owner_id_deleted_at', table_name='note_tombstones')
+    op.drop_table('note_tombstones')
@@ -0,0 +1,34 @@
+"""Add note changed_at for sync
+
+Revision ID: b6d1e4a9c352
+Revises: 7f3a9c2d5e18
+Create Date: 2026-10-18 21:07:33.518240
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b6d1e4a9c352'
+down_revision: Union[str, Sequence[str], None] = '7f3a9c2d5e18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('notes', sa.Column('changed_at', sa.DateTime(timezone=True), nullable=True))
+    op.execute("UPDATE notes SET changed_at = COALESCE(updated_at, created_at)")
+    # Sync now follows changed_at, which also moves when jobs fill in derived fields.
+    op.drop_index('ix_notes_owner_id_updated_at', table_name='notes')
+    op.create_index('ix_notes_owner_id_changed_at', 'notes', ['owner_id', 'changed_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_notes_owner_id_changed_at', table_name='notes')
+    op.create_index('ix_notes_owner_id_updated_at', 'notes', ['owner_id', 'updated_at'], unique=False)
+    op.drop_column('notes', 'changed_at')
@@ -1,32 +1,84 @@
+import asyncio
 import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from typing import Annotated
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from sqlalchemy.orm import Session
-from sqlalchemy import or_
+from sqlalchemy import event, inspect, or_, select
 
-from . import models, schemas
-from .database import get_db
+from . import models, schemas, tokens
+from .cache import TTLCache
+from .database import get_db, run_db
+from .instrumentation import timed_auth
+from .passwords import PASSWORD_HASH_SCHEMES, password_context
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", min(4, os.cpu_count() or 1)))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", PASSWORD_HASH_WORKERS * 8))
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", 60))
+USER_CACHE_MAX_SIZE = int(os.getenv("USER_CACHE_MAX_SIZE", 10000))
+# With the uid claim, note endpoints check the id against ``known_user_ids``
+# (a primary key lookup, cached) instead of resolving the full principal by email.
+TOKEN_INCLUDE_USER_ID = os.getenv("TOKEN_INCLUDE_USER_ID", "true").lower() in ("1", "true", "yes")
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = password_context(PASSWORD_HASH_SCHEMES)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/users/token")
 
+# Resolved principals keyed by token subject, so authenticated requests skip the users lookup.
+user_cache = TTLCache(maxsize=USER_CACHE_MAX_SIZE, ttl=USER_CACHE_TTL_SECONDS)
+# Ids from uid claims that still belong to a user. Deletes through the ORM evict
+# the id at once on this worker; other workers notice within the TTL.
+known_user_ids = TTLCache(maxsize=USER_CACHE_MAX_SIZE, ttl=USER_CACHE_TTL_SECONDS)
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
+def verify_and_update_password(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    """Verify, returning a replacement hash when the stored one uses an outdated scheme or cost."""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+# bcrypt releases the GIL, so a small thread pool keeps the event loop free
+# without the pickling overhead of a process pool.
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+_hash_pending = 0
+
+async def _run_in_hash_pool(func, *args):
+    """Run a hashing call on the dedicated pool, shedding load with 503 when the queue is full."""
+    global _hash_pending
+    if _hash_pending >= PASSWORD_HASH_MAX_PENDING:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy, please retry shortly",
+            headers={"Retry-After": "1"},
+        )
+    _hash_pending += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_hash_executor, func, *args)
+    finally:
+        _hash_pending -= 1
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await _run_in_hash_pool(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    return await _run_in_hash_pool(get_password_hash, password)
+
+async def verify_and_update_password_async(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    return await _run_in_hash_pool(verify_and_update_password, plain_password, hashed_password)
+
 def create_access_token(data: dict, expires_delta: timedelta | None = None) -> str:
-    to_encode = data.copy()
+    to_encode = {"jti": uuid.uuid4().hex, **data}
     if expires_delta:
         expire = datetime.now(timezone.utc) + expires_delta
     else:
@@ -38,37 +90,119 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None) -> s
 def get_user(db: Session, email: str) -> models.User | None:
     return db.query(models.User).filter(models.User.email == email).first()
 
-def authenticate_user(db: Session, identifier: str, password: str) -> models.User | None:
-    user = db.query(models.User).filter(
+def get_user_by_identifier(db: Session, identifier: str) -> models.User | None:
+    return db.query(models.User).filter(
         or_(models.User.email == identifier, models.User.username == identifier)
     ).first()
+
+async def authenticate_user(db: Session, identifier: str, password: str) -> models.User | None:
+    user = await run_db(db, get_user_by_identifier, identifier)
     
     if not user:
         return None
-    if not verify_password(password, user.hashed_password):
+    verified, new_hash = await verify_and_update_password_async(password, user.hashed_password)
+    if not verified:
         return None
+    if new_hash:
+        def rehash(db: Session) -> None:
+            user.hashed_password = new_hash
+            db.commit()
+            db.refresh(user)
+
+        await run_db(db, rehash)
         
     return user
 
-async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], db: Session = Depends(get_db)) -> models.User:
-    credentials_exception = HTTPException(
+def token_claims(user: models.User) -> dict:
+    claims = {"sub": user.email}
+    if TOKEN_INCLUDE_USER_ID:
+        claims["uid"] = user.id
+    return claims
+
+def invalidate_user(email: str, user_id: int | None = None) -> None:
+    user_cache.delete(email)
+    if user_id is not None:
+        known_user_ids.delete(user_id)
+
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _invalidate_cached_user(mapper, connection, target: models.User) -> None:
+    invalidate_user(target.email, target.id)
+    for previous_email in inspect(target).attrs.email.history.deleted:
+        invalidate_user(previous_email)
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def decode_access_token(token: str) -> schemas.TokenData:
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        with timed_auth():
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str | None = payload.get("sub")
         if email is None:
-            raise credentials_exception
-        token_data = schemas.TokenData(email=email)
+            raise _credentials_exception()
+        return schemas.TokenData(
+            email=email,
+            user_id=payload.get("uid"),
+            jti=payload.get("jti"),
+            expires_at=datetime.fromtimestamp(payload["exp"], timezone.utc) if "exp" in payload else None,
+        )
     except JWTError:
-        raise credentials_exception
-    
-    user = get_user(db, email=token_data.email)
+        raise _credentials_exception()
+
+async def check_not_revoked(db: Session, token_data: schemas.TokenData) -> None:
+    """Reject revoked tokens with an in-memory lookup, reloading the list when it is stale."""
+    if tokens.revoked_access_tokens.needs_sync():
+        await run_db(db, tokens.revoked_access_tokens.sync)
+    if token_data.jti is not None and token_data.jti in tokens.revoked_access_tokens:
+        raise _credentials_exception()
+
+def _user_exists(db: Session, user_id: int) -> bool:
+    return db.scalar(select(models.User.id).where(models.User.id == user_id)) is not None
+
+def _load_principal(db: Session, email: str) -> schemas.UserInDB | None:
+    user = get_user(db, email=email)
+    return schemas.UserInDB.model_validate(user) if user is not None else None
+
+async def resolve_principal(db: Session, email: str) -> schemas.UserInDB | None:
+    principal = user_cache.get(email)
+    if principal is None:
+        principal = await run_db(db, _load_principal, email)
+        if principal is None:
+            return None
+        user_cache.set(email, principal)
+    return principal
+
+async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], db: Session = Depends(get_db)) -> schemas.UserInDB:
+    token_data = decode_access_token(token)
+    await check_not_revoked(db, token_data)
+    user = await resolve_principal(db, email=token_data.email)
     if user is None:
-        raise credentials_exception
+        raise _credentials_exception()
     return user
 
-async def get_current_active_user(current_user: Annotated[models.User, Depends(get_current_user)]) -> models.User:
+async def get_current_active_user(current_user: Annotated[schemas.UserInDB, Depends(get_current_user)]) -> schemas.UserInDB:
     return current_user
+
+async def get_current_user_id(token: Annotated[str, Depends(oauth2_scheme)], db: Session = Depends(get_db)) -> int:
+    """Return the caller's user id, from the token claims when it carries one.
+
+    The id is still checked against ``known_user_ids``, so a deleted user's
+    tokens stop working instead of writing notes for a missing owner.
+    """
+    token_data = decode_access_token(token)
+    await check_not_revoked(db, token_data)
+    if token_data.user_id is not None:
+        if known_user_ids.get(token_data.user_id) is None:
+            if not await run_db(db, _user_exists, token_data.user_id):
+                raise _credentials_exception()
+            known_user_ids.set(token_data.user_id, True)
+        return token_data.user_id
+    user = await resolve_principal(db, email=token_data.email)
+    if user is None:
+        raise _credentials_exception()
+    return user.id
@@ -0,0 +1,216 @@
+import itertools
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Iterable
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire ``ttl`` seconds after being set."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._data), "maxsize": self.maxsize}
+
+class CacheBackend:
+    """Byte-oriented store behind the response cache.
+
+    The operations map one-to-one onto Redis commands (GET, SET EX, DEL, INCR),
+    so a Redis-compatible client can be dropped in for multi-worker deployments.
+    """
+
+    def get(self, key: str) -> bytes | None:
+        raise NotImplementedError
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        raise NotImplementedError
+
+    def delete(self, *keys: str) -> None:
+        raise NotImplementedError
+
+    def incr(self, key: str) -> int:
+        raise NotImplementedError
+
+    def counter(self, key: str) -> int:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+class MemoryCacheBackend(CacheBackend):
+    """In-process backend: LRU+TTL entries and LRU counters, each bounded by ``maxsize``.
+
+    A counter that is missing or was evicted starts from a process-wide
+    sequence instead of zero, so an owner's generation never comes back to a
+    value that cached pages were stored under.
+    """
+
+    def __init__(self, maxsize: int):
+        self._entries = TTLCache(maxsize=maxsize, ttl=float("inf"))
+        self._counters = TTLCache(maxsize=maxsize, ttl=float("inf"))
+        self._sequence = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> bytes | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            self._entries.delete(key)
+            return None
+        return value
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        self._entries.set(key, (time.monotonic() + ttl, value))
+
+    def delete(self, *keys: str) -> None:
+        for key in keys:
+            self._entries.delete(key)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            value = next(self._sequence)
+            self._counters.set(key, value)
+            return value
+
+    def counter(self, key: str) -> int:
+        with self._lock:
+            value = self._counters.get(key)
+            if value is None:
+                value = next(self._sequence)
+                self._counters.set(key, value)
+            return value
+
+    def clear(self) -> None:
+        self._entries.clear()
+        with self._lock:
+            self._counters.clear()
+
+class CachedResponse:
+    def __init__(self, body: bytes, headers: dict[str, str]):
+        self.body = body
+        self.headers = headers
+
+    def pack(self) -> bytes:
+        return json.dumps(self.headers, separators=(",", ":")).encode() + b"\n" + self.body
+
+    @classmethod
+    def unpack(cls, data: bytes) -> "CachedResponse":
+        headers, _, body = data.partition(b"\n")
+        return cls(body, json.loads(headers))
+
+class NoteResponseCache:
+    """Pre-serialized note responses, keyed per owner.
+
+    Every write bumps a per-owner generation and deletes the written notes.
+    List pages embed the generation in their key, so one bump orphans all of
+    that owner's pages; orphans age out through the TTL and LRU. Callers take
+    the generation before reading the database and pass it back when storing,
+    so a read that raced a write is never cached. With the in-process backend
+    each worker invalidates only its own copy, so the TTL bounds how long
+    other workers can serve a note as it was before a write; keep it short
+    unless the backend is shared.
+    """
+
+    def __init__(self, backend: CacheBackend, ttl: float, enabled: bool = True):
+        self.backend = backend
+        self.ttl = ttl
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+
+    def _record(self, data: bytes | None) -> CachedResponse | None:
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return CachedResponse.unpack(data)
+
+    def generation(self, owner_id: int) -> int:
+        return self.backend.counter(f"notes-gen:{owner_id}")
+
+    def get_note(self, owner_id: int, note_id: int) -> CachedResponse | None:
+        if not self.enabled:
+            return None
+        return self._record(self.backend.get(f"note:{owner_id}:{note_id}"))
+
+    def set_note(self, owner_id: int, note_id: int, response: CachedResponse, generation: int) -> None:
+        if self.enabled and self.generation(owner_id) == generation:
+            self.backend.set(f"note:{owner_id}:{note_id}", response.pack(), self.ttl)
+
+    def get_list(self, owner_id: int, params: str, generation: int) -> CachedResponse | None:
+        if not self.enabled:
+            return None
+        return self._record(self.backend.get(f"notes:{owner_id}:{generation}:{params}"))
+
+    def set_list(self, owner_id: int, params: str, response: CachedResponse, generation: int) -> None:
+        if self.enabled and self.generation(owner_id) == generation:
+            self.backend.set(f"notes:{owner_id}:{generation}:{params}", response.pack(), self.ttl)
+
+    def invalidate(self, owner_id: int, note_ids: Iterable[int] = ()) -> None:
+        self.backend.delete(*(f"note:{owner_id}:{note_id}" for note_id in note_ids))
+        self.backend.incr(f"notes-gen:{owner_id}")
+
+    def clear(self) -> None:
+        self.backend.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+NOTE_CACHE_ENABLED = os.getenv("NOTE_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+# With several workers and the in-process backend, a user can read their own
+# write as stale for up to this long on a worker that did not handle it.
+NOTE_CACHE_TTL_SECONDS = float(os.getenv("NOTE_CACHE_TTL_SECONDS", 2))
+NOTE_CACHE_MAX_ENTRIES = int(os.getenv("NOTE_CACHE_MAX_ENTRIES", 10000))
+
+note_cache = NoteResponseCache(
+    MemoryCacheBackend(maxsize=NOTE_CACHE_MAX_ENTRIES), ttl=NOTE_CACHE_TTL_SECONDS, enabled=NOTE_CACHE_ENABLED
+)
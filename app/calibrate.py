@@ -0,0 +1,78 @@
+"""Pick password hashing costs that hit a target verify time on this machine.
+
+    python -m app.calibrate --target-ms 250
+    python -m app.calibrate --scheme argon2 --memory-cost 65536 --parallelism 4
+
+Raises the cost until one verify takes at least the target, then prints the
+settings to deploy. Run it on the production hardware: a login then costs a
+known amount of CPU, and PASSWORD_HASH_WORKERS / verify time bounds the
+logins per second each process can absorb.
+"""
+import argparse
+import statistics
+import time
+
+from .passwords import ARGON2_MEMORY_COST, ARGON2_PARALLELISM, password_context
+
+BCRYPT_MIN_ROUNDS, BCRYPT_MAX_ROUNDS = 4, 31
+ARGON2_MAX_TIME_COST = 50
+
+def verify_seconds(context, samples: int) -> float:
+    """Median time of ``samples`` verifies of a hash made with ``context``'s default settings."""
+    hashed = context.hash("calibration-password")
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        context.verify("calibration-password", hashed)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+def calibrate_bcrypt(target: float, samples: int) -> tuple[dict, float]:
+    for rounds in range(BCRYPT_MIN_ROUNDS, BCRYPT_MAX_ROUNDS + 1):
+        seconds = verify_seconds(password_context(["bcrypt"], bcrypt_rounds=rounds), samples)
+        print(f"  bcrypt rounds={rounds}: {seconds * 1000:.1f} ms")
+        if seconds >= target:
+            break
+    return {"PASSWORD_HASH_SCHEMES": "bcrypt", "BCRYPT_ROUNDS": rounds}, seconds
+
+def calibrate_argon2(target: float, samples: int, memory_cost: int, parallelism: int) -> tuple[dict, float]:
+    for time_cost in range(1, ARGON2_MAX_TIME_COST + 1):
+        context = password_context(
+            ["argon2"], argon2_time_cost=time_cost, argon2_memory_cost=memory_cost, argon2_parallelism=parallelism
+        )
+        seconds = verify_seconds(context, samples)
+        print(f"  argon2 time_cost={time_cost} memory_cost={memory_cost} KiB: {seconds * 1000:.1f} ms")
+        if seconds >= target:
+            break
+    settings = {
+        "PASSWORD_HASH_SCHEMES": "argon2,bcrypt",
+        "ARGON2_TIME_COST": time_cost,
+        "ARGON2_MEMORY_COST": memory_cost,
+        "ARGON2_PARALLELISM": parallelism,
+    }
+    return settings, seconds
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scheme", choices=["bcrypt", "argon2"], default="bcrypt")
+    parser.add_argument("--target-ms", type=float, default=250.0, help="desired time for one verify")
+    parser.add_argument("--samples", type=int, default=3, help="verifies timed per candidate cost")
+    parser.add_argument("--memory-cost", type=int, default=ARGON2_MEMORY_COST, help="argon2 memory in KiB")
+    parser.add_argument("--parallelism", type=int, default=ARGON2_PARALLELISM, help="argon2 lanes")
+    args = parser.parse_args(argv)
+
+    target = args.target_ms / 1000
+    print(f"Calibrating {args.scheme} for a {args.target_ms:g} ms verify:")
+    if args.scheme == "bcrypt":
+        settings, seconds = calibrate_bcrypt(target, args.samples)
+    else:
+        settings, seconds = calibrate_argon2(target, args.samples, args.memory_cost, args.parallelism)
+
+    print(f"\nOne verify takes {seconds * 1000:.1f} ms, about {1 / seconds:.1f} logins/s per hashing thread.")
+    print("Existing hashes are upgraded on each user's next login. Settings:\n")
+    for name, value in settings.items():
+        print(f"{name}={value}")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,162 @@
+import gzip
+import json
+import os
+from typing import Callable
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+
+from .cache import TTLCache
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstandard is optional
+    zstandard = None
+
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true").lower() in ("1", "true", "yes")
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", 1024))
+# Compressing a large body ties up the event loop; hand those to the threadpool.
+COMPRESSION_THREAD_MIN_SIZE = int(os.getenv("COMPRESSION_THREAD_MIN_SIZE", 64 * 1024))
+COMPRESSION_CACHE_MAX_ENTRIES = int(os.getenv("COMPRESSION_CACHE_MAX_ENTRIES", 256))
+COMPRESSION_CACHE_TTL_SECONDS = float(os.getenv("COMPRESSION_CACHE_TTL_SECONDS", 300))
+DEFAULT_LEVELS = {
+    "zstd": int(os.getenv("COMPRESSION_ZSTD_LEVEL", 3)),
+    "br": int(os.getenv("COMPRESSION_BROTLI_QUALITY", 4)),
+    "gzip": int(os.getenv("COMPRESSION_GZIP_LEVEL", 6)),
+}
+# Per-route overrides keyed by route path, e.g. '{"/notes/": {"gzip": 9}}'; level 0 disables an encoding.
+ROUTE_LEVELS: dict[str, dict[str, int]] = json.loads(os.getenv("COMPRESSION_ROUTE_LEVELS", "{}"))
+
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/x-ndjson", "application/xml", "application/javascript")
+
+def _gzip(data: bytes, level: int) -> bytes:
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+def _brotli(data: bytes, level: int) -> bytes:
+    return brotli.compress(data, quality=level)
+
+def _zstd(data: bytes, level: int) -> bytes:
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+# In server preference order, for clients that weigh several encodings equally.
+CODECS: dict[str, Callable[[bytes, int], bytes]] = {}
+if zstandard is not None:
+    CODECS["zstd"] = _zstd
+if brotli is not None:
+    CODECS["br"] = _brotli
+CODECS["gzip"] = _gzip
+
+# Compressed bodies keyed by URL, ETag, encoding and level, so unchanged responses
+# are compressed once.
+compressed_cache = TTLCache(maxsize=COMPRESSION_CACHE_MAX_ENTRIES, ttl=COMPRESSION_CACHE_TTL_SECONDS)
+
+def negotiate(accept_encoding: str, levels: dict[str, int]) -> str | None:
+    """Pick the enabled encoding with the highest ``q`` in ``Accept-Encoding``."""
+    weights: dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, *params = [item.strip() for item in part.split(";")]
+        weight = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        if name:
+            weights[name.lower()] = weight
+    best, best_weight = None, 0.0
+    for encoding in CODECS:
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if levels.get(encoding, 0) > 0 and weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+def route_levels(route_path: str | None) -> dict[str, int]:
+    return {**DEFAULT_LEVELS, **ROUTE_LEVELS.get(route_path or "", {})}
+
+async def compress(body: bytes, encoding: str, level: int, cache_key: tuple | None) -> bytes:
+    if cache_key is not None:
+        cached = compressed_cache.get(cache_key)
+        if cached is not None:
+            return cached
+    if len(body) >= COMPRESSION_THREAD_MIN_SIZE:
+        compressed = await run_in_threadpool(CODECS[encoding], body, level)
+    else:
+        compressed = CODECS[encoding](body, level)
+    if cache_key is not None:
+        compressed_cache.set(cache_key, compressed)
+    return compressed
+
+class CompressionMiddleware:
+    """Compresses complete response bodies with the negotiated encoding.
+
+    Streaming responses (more than one body message) pass through untouched, as
+    do bodies under ``COMPRESSION_MIN_SIZE`` and non-text content types. The
+    ETag is kept as is so clients can send it back in ``If-Match``.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not COMPRESSION_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = Headers(scope=scope).get("accept-encoding")
+        if not accept_encoding:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "")
+                if "content-encoding" in headers or not content_type.startswith(COMPRESSIBLE_TYPES):
+                    passthrough = True
+                    await send(message)
+                else:
+                    start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            passthrough = True
+            headers = MutableHeaders(scope=start_message)
+            headers.add_vary_header("Accept-Encoding")
+            body = message.get("body", b"")
+            if message.get("more_body", False) or len(body) < COMPRESSION_MIN_SIZE:
+                await send(start_message)
+                await send(message)
+                return
+
+            route = scope.get("route")
+            levels = route_levels(getattr(route, "path", None))
+            encoding = negotiate(accept_encoding, levels)
+            if encoding is None:
+                await send(start_message)
+                await send(message)
+                return
+
+            etag = headers.get("etag")
+            cache_key = (scope["path"], scope.get("query_string", b""), etag, encoding, levels[encoding]) if etag else None
+            compressed = await compress(body, encoding, levels[encoding], cache_key)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(compressed))
+            await send(start_message)
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,52 @@
+import hashlib
+from typing import Any, Iterable
+
+# ETags have two parts, "<edit>.<derived>". The edit part changes only when a
+# client edits the note; the derived part follows fields that jobs fill in
+# afterwards (app/jobs.py). Reads and caches compare the whole tag, while
+# If-Match compares the edit part, so a job finishing after a save does not
+# make the ETag that save returned stale.
+
+def _version(note: Any) -> str:
+    changed_at = note.updated_at or note.created_at
+    return f"{note.id}:{changed_at.isoformat() if changed_at else ''}"
+
+def _derived(note: Any) -> str:
+    # Projections without the derived columns don't show them, so they don't vary by them.
+    word_count = getattr(note, "word_count", None)
+    return "" if word_count is None else str(word_count)
+
+def note_etag(note: Any) -> str:
+    """Strong validator for a single note: its id and last edit time, then its derived fields."""
+    return '"' + hashlib.sha1(_version(note).encode()).hexdigest() + "." + _derived(note) + '"'
+
+def collection_etag(notes: Iterable[Any]) -> str:
+    digest = hashlib.sha1()
+    for note in notes:
+        digest.update(_version(note).encode())
+        digest.update(b".")
+        digest.update(_derived(note).encode())
+        digest.update(b"\n")
+    return '"' + digest.hexdigest() + '"'
+
+def _edit_part(etag: str) -> str:
+    return etag.strip('"').partition(".")[0]
+
+def etag_matches(header: str | None, etag: str, weak: bool = False, edit_only: bool = False) -> bool:
+    """Evaluate an If-Match (strong) or If-None-Match (weak) header against ``etag``.
+
+    With ``edit_only`` only the edit part of each tag is compared.
+    """
+    if header is None:
+        return False
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            if not weak:
+                continue
+            candidate = candidate[2:]
+        if candidate == etag or (edit_only and _edit_part(candidate) == _edit_part(etag)):
+            return True
+    return False
@@ -0,0 +1,200 @@
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 0))
+
+slow_query_logger = logging.getLogger("app.sql.slow")
+
+class RequestStats:
+    """Timings gathered while serving one request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.auth_seconds = 0.0
+
+    def server_timing(self) -> str:
+        total_ms = (time.perf_counter() - self.started) * 1000
+        return (
+            f'total;dur={total_ms:.2f}, '
+            f'db;dur={self.sql_seconds * 1000:.2f};desc="{self.sql_count} queries", '
+            f'auth;dur={self.auth_seconds * 1000:.2f}'
+        )
+
+_current_stats: ContextVar[RequestStats | None] = ContextVar("request_stats", default=None)
+
+def current_stats() -> RequestStats | None:
+    return _current_stats.get()
+
+@contextmanager
+def timed_auth():
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats = _current_stats.get()
+        if stats is not None:
+            stats.auth_seconds += time.perf_counter() - start
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: tuple[float, ...], label_names: tuple[str, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.label_names = label_names
+        self._series: dict[tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: tuple[str, ...], value: float) -> None:
+        with self._lock:
+            series = self._series.setdefault(labels, [[0] * len(self.buckets), 0, 0.0])
+            index = bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += 1
+            series[2] += value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, (bucket_counts, count, total) in sorted(self._series.items()):
+                label_text = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, labels))
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, bucket_counts):
+                    cumulative += bucket_count
+                    lines.append(f'{self.name}_bucket{{{label_text},le="{bound:g}"}} {cumulative}')
+                lines.append(f'{self.name}_bucket{{{label_text},le="+Inf"}} {count}')
+                lines.append(f"{self.name}_sum{{{label_text}}} {total:.6f}")
+                lines.append(f"{self.name}_count{{{label_text}}} {count}")
+        return lines
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+request_duration = Histogram(
+    "http_request_duration_seconds", "Time to produce the response headers.", _LATENCY_BUCKETS, ("method", "route", "status")
+)
+request_sql_queries = Histogram(
+    "http_request_sql_queries", "SQL statements executed per request.", (0, 1, 2, 3, 5, 10, 20, 50, 100), ("method", "route")
+)
+request_sql_duration = Histogram(
+    "http_request_sql_duration_seconds", "Cumulative SQL time per request.", _LATENCY_BUCKETS, ("method", "route")
+)
+
+HISTOGRAMS = (request_duration, request_sql_queries, request_sql_duration)
+
+def render_histograms() -> list[str]:
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines += histogram.render()
+    return lines
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start_time"].pop()
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.sql_count += 1
+        stats.sql_seconds += elapsed
+    if SLOW_QUERY_MS and elapsed * 1000 >= SLOW_QUERY_MS:
+        slow_query_logger.warning("slow query (%.1f ms): %s", elapsed * 1000, statement)
+
+def instrument_engine(engine: Engine) -> None:
+    """Count and time every statement on ``engine`` against the current request."""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+class QueryCounter:
+    """Records every statement executed on ``engine`` while the block is active.
+
+    Listens on the ``Engine`` class by default, so statements issued from
+    threadpool workers and through the async engine are captured too.
+    """
+
+    def __init__(self, engine=Engine):
+        self.engine = engine
+        self.statements: list[str] = []
+        self._lock = threading.Lock()
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        with self._lock:
+            self.statements.append(statement)
+
+    def __enter__(self) -> "QueryCounter":
+        event.listen(self.engine, "after_cursor_execute", self._record)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        event.remove(self.engine, "after_cursor_execute", self._record)
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def repeated(self, threshold: int = 2) -> dict[str, int]:
+        """Statements executed at least ``threshold`` times, the usual signature of an N+1."""
+        return {statement: n for statement, n in Counter(self.statements).items() if n >= threshold}
+
+    def report(self) -> str:
+        lines = [f"{self.count} statements executed:"]
+        lines += [f"  {statement}" for statement in self.statements]
+        for statement, n in self.repeated().items():
+            lines.append(f"possible N+1, {n}x: {statement}")
+        return "\n".join(lines)
+
+class InstrumentationMiddleware:
+    """Times each HTTP request, adds a ``Server-Timing`` header and feeds the histograms."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current_stats.set(stats)
+        status_code = 500
+        elapsed = None
+
+        async def send_with_timing(message):
+            nonlocal status_code, elapsed
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                elapsed = time.perf_counter() - stats.started
+                MutableHeaders(scope=message).append("Server-Timing", stats.server_timing())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_stats.reset(token)
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            if elapsed is None:
+                elapsed = time.perf_counter() - stats.started
+            request_duration.observe((method, route_path, str(status_code)), elapsed)
+            request_sql_queries.observe((method, route_path), stats.sql_count)
+            request_sql_duration.observe((method, route_path), stats.sql_seconds)
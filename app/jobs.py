@@ -0,0 +1,144 @@
+"""Deferred note post-processing through a transactional outbox.
+
+Write paths insert ``note_jobs`` rows in the same transaction as the note
+change, so a job exists exactly when its change was committed, and call
+``notify`` afterwards to wake the in-process worker. Workers claim due jobs
+with ``FOR UPDATE SKIP LOCKED``, so the in-process worker and any number of
+``python -m app.worker`` processes can share the queue. A failing job is
+retried with exponential backoff and marked ``failed`` after
+``JOBS_MAX_ATTEMPTS``; finished jobs are deleted.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Iterable
+
+from sqlalchemy import bindparam, insert, select, update
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from . import models
+from .cache import note_cache
+from .database import SessionLocal
+
+JOBS_IN_PROCESS = os.getenv("JOBS_IN_PROCESS", "true").lower() in ("1", "true", "yes")
+JOBS_POLL_SECONDS = float(os.getenv("JOBS_POLL_SECONDS", 5))
+JOBS_BATCH_SIZE = int(os.getenv("JOBS_BATCH_SIZE", 100))
+JOBS_MAX_ATTEMPTS = int(os.getenv("JOBS_MAX_ATTEMPTS", 5))
+JOBS_BACKOFF_SECONDS = float(os.getenv("JOBS_BACKOFF_SECONDS", 2))
+
+logger = logging.getLogger("app.jobs")
+
+# kind -> handler(db, job); runs inside the claiming transaction and must not commit.
+HANDLERS: dict[str, Callable[[Session, models.NoteJob], None]] = {}
+
+def handler(kind: str):
+    def register(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return register
+
+# Jobs every note change needs; the routers enqueue these.
+NOTE_CHANGED_JOBS = ("word_count",)
+
+def enqueue(db: Session, owner_id: int, note_ids: Iterable[int | None], kinds: Iterable[str] = NOTE_CHANGED_JOBS) -> None:
+    """Add jobs to the caller's transaction. A ``None`` note id covers all of the owner's notes."""
+    rows = [{"kind": kind, "note_id": note_id, "owner_id": owner_id} for note_id in note_ids for kind in kinds]
+    if rows:
+        db.execute(insert(models.NoteJob), rows)
+
+# The running worker's wake-up event. Events bind to the loop that first waits on
+# them, so each worker makes its own rather than sharing one across lifespans.
+_wakeup: asyncio.Event | None = None
+
+def notify() -> None:
+    """Wake the in-process worker after a commit that enqueued jobs. Call from the event loop."""
+    if _wakeup is not None:
+        _wakeup.set()
+
+def run_pending(db: Session, limit: int = JOBS_BATCH_SIZE) -> int:
+    """Claim and run up to ``limit`` due jobs in one transaction; returns how many were claimed."""
+    now = datetime.now(timezone.utc)
+    claimed = db.scalars(
+        select(models.NoteJob)
+        .where(models.NoteJob.status == "pending", models.NoteJob.run_after <= now)
+        .order_by(models.NoteJob.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    ).all()
+    touched: dict[int, set[int]] = {}
+    for job in claimed:
+        try:
+            with db.begin_nested():
+                HANDLERS[job.kind](db, job)
+        except Exception as exc:
+            job.attempts += 1
+            job.last_error = repr(exc)[:500]
+            if job.attempts >= JOBS_MAX_ATTEMPTS:
+                job.status = "failed"
+                logger.error("job %s (%s) failed permanently: %r", job.id, job.kind, exc)
+            else:
+                job.run_after = now + timedelta(seconds=JOBS_BACKOFF_SECONDS * 2 ** (job.attempts - 1))
+                logger.warning("job %s (%s) failed, retrying at %s: %r", job.id, job.kind, job.run_after, exc)
+        else:
+            touched.setdefault(job.owner_id, set()).add(job.note_id)
+            db.delete(job)
+    db.commit()
+    # Derived fields are part of the cached responses. Other processes' caches age out through the TTL.
+    for owner_id, note_ids in touched.items():
+        note_cache.invalidate(owner_id, [note_id for note_id in note_ids if note_id is not None])
+    return len(claimed)
+
+def _run_batch() -> int:
+    with SessionLocal() as db:
+        return run_pending(db)
+
+async def worker(stop: asyncio.Event) -> None:
+    """Drain due jobs until ``stop`` is set, sleeping until notified or the next poll."""
+    global _wakeup
+    wakeup = _wakeup = asyncio.Event()
+    try:
+        while not stop.is_set():
+            wakeup.clear()
+            try:
+                claimed = await run_in_threadpool(_run_batch)
+            except Exception:
+                logger.exception("job batch failed")
+                claimed = 0
+            if claimed >= JOBS_BATCH_SIZE:
+                continue
+            waiters = [asyncio.ensure_future(wakeup.wait()), asyncio.ensure_future(stop.wait())]
+            done, _ = await asyncio.wait(waiters, timeout=JOBS_POLL_SECONDS, return_when=asyncio.FIRST_COMPLETED)
+            for waiter in waiters:
+                waiter.cancel()
+            failed = [waiter.exception() for waiter in done if not waiter.cancelled() and waiter.exception() is not None]
+            if failed:
+                # Waiting again right away would spin; fall back to plain polling.
+                logger.error("job worker wait failed: %r", failed[0])
+                await asyncio.sleep(JOBS_POLL_SECONDS)
+    finally:
+        if _wakeup is wakeup:
+            _wakeup = None
+
+def count_words(text: str) -> int:
+    return len(text.split())
+
+@handler("word_count")
+def update_word_count(db: Session, job: models.NoteJob) -> None:
+    query = select(models.Note.id, models.Note.content).where(models.Note.owner_id == job.owner_id)
+    if job.note_id is not None:
+        query = query.where(models.Note.id == job.note_id)
+    else:
+        query = query.where(models.Note.word_count.is_(None))
+    table = models.Note.__table__
+    # A derived field is not an edit: updated_at and the ETag's edit part stay put,
+    # so clients can keep saving with the ETag they have. changed_at still moves
+    # (its onupdate), which changes the ETag's derived part and feeds /notes/changes.
+    statement = (
+        update(table)
+        .where(table.c.id == bindparam("note_id"))
+        .values(word_count=bindparam("count"), updated_at=table.c.updated_at)
+    )
+    for partition in db.execute(query.execution_options(yield_per=JOBS_BATCH_SIZE)).partitions():
+        db.execute(statement, [{"note_id": note_id, "count": count_words(content)} for note_id, content in partition])
@@ -1,9 +1,15 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime
+import os
+
+from sqlalchemy import DDL, Boolean, Column, Integer, LargeBinary, String, ForeignKey, DateTime, Index, event
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
 from .database import Base
 
+# Loader strategy for User.notes and Note.owner. "raise_on_sql" turns an accidental
+# lazy load into an error, which is how the test suite runs.
+RELATIONSHIP_LOADING = os.getenv("RELATIONSHIP_LOADING", "select")
+
 class User(Base):
     __tablename__ = "users"
 
@@ -12,7 +18,7 @@ class User(Base):
     username = Column(String, unique=True, index=True, nullable=False)
     hashed_password = Column(String, nullable=False)
   
-    notes = relationship("Note", back_populates="owner")
+    notes = relationship("Note", back_populates="owner", lazy=RELATIONSHIP_LOADING)
 
 class Note(Base):
     __tablename__ = "notes"
@@ -21,6 +27,111 @@ class Note(Base):
     title = Column(String, index=True, nullable=False)
     content = Column(String, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    updated_at = Column(DateTime(timezone=True), default=func.now(), onupdate=func.now())
     owner_id = Column(Integer, ForeignKey("users.id"))
-    owner = relationship("User", back_populates="notes")
+    # Filled in by the word_count job (app/jobs.py) after each change; null until then.
+    word_count = Column(Integer)
+    # Last change of anything in the note's representation, edits and derived
+    # fields alike; /notes/changes follows this. updated_at covers edits only.
+    changed_at = Column(DateTime(timezone=True), default=func.now(), onupdate=func.now())
+    owner = relationship("User", back_populates="notes", lazy=RELATIONSHIP_LOADING)
+
+    __table_args__ = (
+        Index("ix_notes_owner_id_id", "owner_id", "id"),
+        Index("ix_notes_owner_id_changed_at", "owner_id", "changed_at"),
+        # Never reuse ids of deleted notes; sync clients identify tombstones by id.
+        {"sqlite_autoincrement": True},
+    )
+
+class NoteTombstone(Base):
+    """Record of a deleted note, so sync clients can learn about deletions."""
+    __tablename__ = "note_tombstones"
+
+    id = Column(Integer, primary_key=True)
+    note_id = Column(Integer, nullable=False)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    deleted_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index("ix_note_tombstones_owner_id_deleted_at", "owner_id", "deleted_at"),
+    )
+
+class NoteRevision(Base):
+    """A previous version of a note, as a compressed delta or snapshot (see app/revisions.py)."""
+    __tablename__ = "note_revisions"
+
+    id = Column(Integer, primary_key=True)
+    note_id = Column(Integer, nullable=False)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    version = Column(Integer, nullable=False)
+    is_snapshot = Column(Boolean, nullable=False)
+    saved_at = Column(DateTime(timezone=True))
+    size = Column(Integer, nullable=False)
+    data = Column(LargeBinary, nullable=False)
+
+    __table_args__ = (
+        Index("ix_note_revisions_note_id_version", "note_id", "version", unique=True),
+    )
+
+class NoteJob(Base):
+    """Outbox row for deferred note processing, written in the same transaction as the change."""
+    __tablename__ = "note_jobs"
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(50), nullable=False)
+    note_id = Column(Integer)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    status = Column(String(16), nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    run_after = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    last_error = Column(String)
+
+    __table_args__ = (
+        Index("ix_note_jobs_status_run_after", "status", "run_after"),
+    )
+
+class RefreshToken(Base):
+    """A refresh token, stored as its SHA-256 digest. Rotation keeps the family id."""
+    __tablename__ = "refresh_tokens"
+
+    id = Column(Integer, primary_key=True)
+    token_hash = Column(String(64), unique=True, nullable=False)
+    family_id = Column(String(32), index=True, nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    revoked_at = Column(DateTime(timezone=True))
+
+class RevokedToken(Base):
+    """A revoked access token, kept until the token would have expired anyway."""
+    __tablename__ = "revoked_tokens"
+
+    jti = Column(String(32), primary_key=True)
+    expires_at = Column(DateTime(timezone=True), index=True, nullable=False)
+
+# Full-text search lives outside the ORM mapping: a generated tsvector column with a
+# GIN index on Postgres, and an external-content FTS5 table kept in sync by triggers
+# on SQLite. See app/search.py for the queries.
+NOTES_SEARCH_DDL = {
+    "postgresql": [
+        "ALTER TABLE notes ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ("
+        "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+        "setweight(to_tsvector('english', coalesce(content, '')), 'B')) STORED",
+        "CREATE INDEX IF NOT EXISTS ix_notes_search_vector ON notes USING gin (search_vector)",
+    ],
+    "sqlite": [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(title, content, content='notes', content_rowid='id')",
+        "CREATE TRIGGER IF NOT EXISTS notes_fts_ai AFTER INSERT ON notes BEGIN "
+        "INSERT INTO notes_fts(rowid, title, content) VALUES (new.id, new.title, new.content); END",
+        "CREATE TRIGGER IF NOT EXISTS notes_fts_ad AFTER DELETE ON notes BEGIN "
+        "INSERT INTO notes_fts(notes_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content); END",
+        "CREATE TRIGGER IF NOT EXISTS notes_fts_au AFTER UPDATE OF title, content ON notes BEGIN "
+        "INSERT INTO notes_fts(notes_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content); "
+        "INSERT INTO notes_fts(rowid, title, content) VALUES (new.id, new.title, new.content); END",
+    ],
+}
+
+for _dialect, _statements in NOTES_SEARCH_DDL.items():
+    for _statement in _statements:
+        event.listen(Note.__table__, "after_create", DDL(_statement).execute_if(dialect=_dialect))
+event.listen(Note.__table__, "before_drop", DDL("DROP TABLE IF EXISTS notes_fts").execute_if(dialect="sqlite"))
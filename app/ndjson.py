@@ -0,0 +1,130 @@
+import csv
+import io
+import os
+import zlib
+from typing import AsyncIterator, Iterator
+
+from sqlalchemy import DateTime, func, insert, select
+from sqlalchemy.orm import Session
+
+from . import jobs, models
+from .serialization import NOTE_COLUMNS, dumps
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 500))
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", 500))
+IMPORT_MAX_LINE_BYTES = int(os.getenv("IMPORT_MAX_LINE_BYTES", 16 * 1024 * 1024))
+# Counted after decompression, so a small gzip body cannot expand without bound.
+IMPORT_MAX_BODY_BYTES = int(os.getenv("IMPORT_MAX_BODY_BYTES", 1024 * 1024 * 1024))
+# Largest piece one decompress call may produce from a received chunk.
+IMPORT_DECOMPRESS_CHUNK_BYTES = 64 * 1024
+
+class LineTooLong(Exception):
+    def __init__(self, line_number: int):
+        super().__init__(f"Line {line_number} exceeds {IMPORT_MAX_LINE_BYTES} bytes")
+        self.line_number = line_number
+
+class BodyTooLarge(Exception):
+    def __init__(self, line_number: int):
+        super().__init__(f"Body exceeds {IMPORT_MAX_BODY_BYTES} bytes")
+        self.line_number = line_number
+
+_NOTE_KEYS = [column.key for column in NOTE_COLUMNS]
+
+def _export_query(owner_id: int):
+    # yield_per streams rows from a server-side cursor in fixed-size batches.
+    return (
+        select(*NOTE_COLUMNS)
+        .where(models.Note.owner_id == owner_id)
+        .order_by(models.Note.id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+
+def _encode_batch(rows) -> bytes:
+    return b"".join(dumps(dict(zip(_NOTE_KEYS, row))) + b"\n" for row in rows)
+
+def iter_notes(db: Session, owner_id: int) -> Iterator[bytes]:
+    """NDJSON for all of an owner's notes, one chunk per batch."""
+    for partition in db.execute(_export_query(owner_id)).partitions():
+        yield _encode_batch(partition)
+
+async def aiter_notes(db, owner_id: int) -> AsyncIterator[bytes]:
+    result = await db.stream(_export_query(owner_id))
+    async for partition in result.partitions():
+        yield _encode_batch(partition)
+
+def gzip_chunks(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+async def agzip_chunks(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(wbits=31)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+def _inflate(decompressor, chunk: bytes) -> Iterator[bytes]:
+    """Decompress ``chunk`` at most ``IMPORT_DECOMPRESS_CHUNK_BYTES`` at a time."""
+    while chunk:
+        data = decompressor.decompress(chunk, IMPORT_DECOMPRESS_CHUNK_BYTES)
+        chunk = decompressor.unconsumed_tail
+        if data:
+            yield data
+
+async def aiter_lines(chunks: AsyncIterator[bytes], gzipped: bool = False) -> AsyncIterator[tuple[int, bytes]]:
+    """Split a (possibly gzipped) byte stream into numbered, non-blank lines as it arrives.
+
+    Raises ``LineTooLong`` or ``BodyTooLarge`` as soon as a limit is crossed,
+    measuring decompressed bytes.
+    """
+    decompressor = zlib.decompressobj(wbits=47) if gzipped else None
+    buffer = b""
+    line_number = 0
+    received = 0
+    async for chunk in chunks:
+        for data in (_inflate(decompressor, chunk) if decompressor is not None else (chunk,)):
+            received += len(data)
+            if received > IMPORT_MAX_BODY_BYTES:
+                raise BodyTooLarge(line_number + 1)
+            buffer += data
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                line_number += 1
+                if line.strip():
+                    yield line_number, line
+            if len(buffer) > IMPORT_MAX_LINE_BYTES:
+                raise LineTooLong(line_number + 1)
+    if decompressor is not None:
+        tail = decompressor.flush(IMPORT_DECOMPRESS_CHUNK_BYTES)
+        if received + len(tail) > IMPORT_MAX_BODY_BYTES:
+            raise BodyTooLarge(line_number + 1)
+        buffer += tail
+    if buffer.strip():
+        yield line_number + 1, buffer
+
+def insert_notes(db: Session, rows: list[dict]) -> None:
+    """Insert one batch of ``{title, content, owner_id}`` rows and commit it.
+
+    psycopg2 connections use ``COPY``; everything else gets a multi-row INSERT.
+    """
+    bind = db.get_bind()
+    if bind.dialect.name == "postgresql" and bind.dialect.driver == "psycopg2":
+        # COPY bypasses SQLAlchemy's column defaults, so stamp updated_at and changed_at here.
+        now = db.scalar(select(func.now(type_=DateTime(timezone=True)))).isoformat()
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow((row["title"], row["content"], row["owner_id"], now, now))
+        buffer.seek(0)
+        cursor = db.connection().connection.cursor()
+        cursor.copy_expert("COPY notes (title, content, owner_id, updated_at, changed_at) FROM STDIN WITH (FORMAT csv)", buffer)
+    else:
+        db.execute(insert(models.Note), rows)
+    # COPY returns no ids, so one job per batch fills in whichever of the owner's notes still lack counts.
+    jobs.enqueue(db, rows[0]["owner_id"], [None])
+    db.commit()
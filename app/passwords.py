@@ -0,0 +1,35 @@
+import os
+
+from passlib.context import CryptContext
+
+# The first scheme hashes new passwords; the others are still verified and rehashed on login.
+# argon2 needs the argon2-cffi package. Run `python -m app.calibrate` to pick costs for this hardware.
+PASSWORD_HASH_SCHEMES = [s.strip() for s in os.getenv("PASSWORD_HASH_SCHEMES", "bcrypt").split(",") if s.strip()]
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", 3))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", 65536))
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", 4))
+
+def password_context(
+    schemes: list[str],
+    bcrypt_rounds: int = BCRYPT_ROUNDS,
+    argon2_time_cost: int = ARGON2_TIME_COST,
+    argon2_memory_cost: int = ARGON2_MEMORY_COST,
+    argon2_parallelism: int = ARGON2_PARALLELISM,
+) -> CryptContext:
+    """Hash with ``schemes[0]`` at exactly the given cost; any other scheme or cost needs an update."""
+    # Existing hashes are bcrypt, so it stays verifiable whatever the default is.
+    schemes = schemes + [scheme for scheme in ("bcrypt",) if scheme not in schemes]
+    settings = {}
+    if "bcrypt" in schemes:
+        settings.update(bcrypt__default_rounds=bcrypt_rounds, bcrypt__min_rounds=bcrypt_rounds, bcrypt__max_rounds=bcrypt_rounds)
+    if "argon2" in schemes:
+        settings.update(
+            argon2__default_rounds=argon2_time_cost,
+            argon2__min_rounds=argon2_time_cost,
+            argon2__max_rounds=argon2_time_cost,
+            argon2__memory_cost=argon2_memory_cost,
+            argon2__parallelism=argon2_parallelism,
+        )
+    return CryptContext(schemes=schemes, deprecated="auto", **settings)
+
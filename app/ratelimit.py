@@ -0,0 +1,145 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Annotated, NamedTuple
+
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.security import OAuth2PasswordRequestForm
+from starlette.datastructures import MutableHeaders
+
+from . import auth
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+# Only honour X-Forwarded-For behind a proxy that sets it; otherwise clients pick their own key.
+RATE_LIMIT_TRUST_FORWARDED = os.getenv("RATE_LIMIT_TRUST_FORWARDED", "false").lower() in ("1", "true", "yes")
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", 100000))
+API_RATE_LIMIT_PER_MINUTE = int(os.getenv("API_RATE_LIMIT_PER_MINUTE", 600))
+LOGIN_RATE_LIMIT_PER_MINUTE = int(os.getenv("LOGIN_RATE_LIMIT_PER_MINUTE", 20))
+LOGIN_ACCOUNT_RATE_LIMIT_PER_MINUTE = int(os.getenv("LOGIN_ACCOUNT_RATE_LIMIT_PER_MINUTE", 10))
+REGISTER_RATE_LIMIT_PER_MINUTE = int(os.getenv("REGISTER_RATE_LIMIT_PER_MINUTE", 5))
+
+class RateLimitResult(NamedTuple):
+    allowed: bool
+    remaining: int
+    reset_after: float
+    retry_after: float
+
+class RateLimitStore:
+    """Token buckets shared by every limiter.
+
+    ``take`` must refill and spend atomically; a Redis implementation does it
+    in one Lua script so all workers draw from the same buckets.
+    """
+
+    def take(self, key: str, capacity: int, refill_per_second: float, cost: int = 1) -> RateLimitResult:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+class MemoryRateLimitStore(RateLimitStore):
+    """Per-process buckets; with N workers a client effectively gets N times the budget."""
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, capacity: int, refill_per_second: float, cost: int = 1) -> RateLimitResult:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * refill_per_second)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            # The least recently used buckets are the ones most likely to be full again.
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return RateLimitResult(
+            allowed=allowed,
+            remaining=int(tokens),
+            reset_after=(capacity - tokens) / refill_per_second,
+            retry_after=0.0 if allowed else (cost - tokens) / refill_per_second,
+        )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+store: RateLimitStore = MemoryRateLimitStore(max_keys=RATE_LIMIT_MAX_KEYS)
+
+class RateLimit:
+    """A token bucket of ``limit`` requests per ``window`` seconds, one bucket per key."""
+
+    def __init__(self, name: str, limit: int, window: float = 60):
+        self.name = name
+        self.limit = limit
+        self.window = window
+
+    def hit(self, request: Request, key: str) -> None:
+        if not RATE_LIMIT_ENABLED:
+            return
+        result = store.take(f"{self.name}:{key}", self.limit, self.limit / self.window)
+        previous = getattr(request.state, "rate_limit", None)
+        # Report whichever bucket is closest to running out.
+        if previous is None or result.remaining <= previous[1].remaining:
+            request.state.rate_limit = (self, result)
+        if not result.allowed:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests",
+                headers={"Retry-After": str(math.ceil(result.retry_after))},
+            )
+
+api_limit = RateLimit("api", API_RATE_LIMIT_PER_MINUTE)
+login_limit = RateLimit("login-ip", LOGIN_RATE_LIMIT_PER_MINUTE)
+login_account_limit = RateLimit("login-account", LOGIN_ACCOUNT_RATE_LIMIT_PER_MINUTE)
+register_limit = RateLimit("register-ip", REGISTER_RATE_LIMIT_PER_MINUTE)
+
+def client_ip(request: Request) -> str:
+    if RATE_LIMIT_TRUST_FORWARDED:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+async def limit_user(request: Request, current_user_id: Annotated[int, Depends(auth.get_current_user_id)]) -> None:
+    api_limit.hit(request, str(current_user_id))
+
+async def limit_login(request: Request, form_data: Annotated[OAuth2PasswordRequestForm, Depends()]) -> None:
+    """Runs before any password hashing, per client IP and per targeted account."""
+    login_limit.hit(request, client_ip(request))
+    login_account_limit.hit(request, form_data.username.lower())
+
+async def limit_register(request: Request) -> None:
+    register_limit.hit(request, client_ip(request))
+
+class RateLimitHeadersMiddleware:
+    """Adds ``RateLimit-*`` headers for the bucket a limiter dependency recorded on the request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                recorded = scope.get("state", {}).get("rate_limit")
+                if recorded is not None:
+                    limiter, result = recorded
+                    headers = MutableHeaders(scope=message)
+                    headers["RateLimit-Limit"] = str(limiter.limit)
+                    headers["RateLimit-Remaining"] = str(result.remaining)
+                    headers["RateLimit-Reset"] = str(math.ceil(result.reset_after))
+                    headers["RateLimit-Policy"] = f"{limiter.limit};w={limiter.window:g}"
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
@@ -0,0 +1,150 @@
+import json
+import os
+import zlib
+from datetime import datetime
+from difflib import SequenceMatcher
+from typing import Any, Iterable, NamedTuple
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from . import models
+
+# Every Nth revision is stored whole, so rebuilding any version applies fewer than N deltas.
+NOTE_REVISION_SNAPSHOT_INTERVAL = max(1, int(os.getenv("NOTE_REVISION_SNAPSHOT_INTERVAL", 20)))
+
+# History is stored backwards from the note itself, which is always the newest
+# version. Revision v holds the state the note had before its v-th edit, as a
+# delta that turns version v + 1 back into version v, or every Nth one as a full
+# snapshot. Creating a note stores nothing; it becomes revision 1 on first edit.
+
+class Edit(NamedTuple):
+    note_id: int
+    saved_at: datetime | None
+    old_title: str
+    old_content: str
+    new_title: str
+    new_content: str
+
+def diff(source: str, target: str) -> list[Any]:
+    """Line ops turning ``source`` into ``target``: n copies n lines, -n skips n, a list inserts lines."""
+    source_lines, target_lines = source.splitlines(keepends=True), target.splitlines(keepends=True)
+    ops: list[Any] = []
+    matcher = SequenceMatcher(None, source_lines, target_lines)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append(i2 - i1)
+            continue
+        if i2 > i1:
+            ops.append(i1 - i2)
+        if j2 > j1:
+            ops.append(target_lines[j1:j2])
+    return ops
+
+def apply_diff(source: str, ops: list[Any]) -> str:
+    lines, position, result = source.splitlines(keepends=True), 0, []
+    for op in ops:
+        if isinstance(op, list):
+            result.extend(op)
+        elif op > 0:
+            result.extend(lines[position:position + op])
+            position += op
+        else:
+            position -= op
+    return "".join(result)
+
+def _pack(data: dict) -> bytes:
+    return zlib.compress(json.dumps(data, separators=(",", ":")).encode())
+
+def _unpack(data: bytes) -> dict:
+    return json.loads(zlib.decompress(data))
+
+def head_versions(db: Session, note_ids: Iterable[int]) -> dict[int, int]:
+    """The current version number of each note: one past its newest revision."""
+    note_ids = list(note_ids)
+    stored = dict(db.execute(
+        select(models.NoteRevision.note_id, func.max(models.NoteRevision.version))
+        .where(models.NoteRevision.note_id.in_(note_ids))
+        .group_by(models.NoteRevision.note_id)
+    ).all())
+    return {note_id: stored.get(note_id, 0) + 1 for note_id in note_ids}
+
+def record_revisions(db: Session, owner_id: int, edits: Iterable[Edit]) -> None:
+    """Store the pre-edit state of each edited note. The caller holds the note rows locked and commits."""
+    edits = [edit for edit in edits if (edit.old_title, edit.old_content) != (edit.new_title, edit.new_content)]
+    if not edits:
+        return
+    versions = head_versions(db, [edit.note_id for edit in edits])
+    rows = []
+    for edit in edits:
+        version = versions[edit.note_id]
+        snapshot = version % NOTE_REVISION_SNAPSHOT_INTERVAL == 0
+        if snapshot:
+            payload = {"title": edit.old_title, "content": edit.old_content}
+        else:
+            payload = {"ops": diff(edit.new_content, edit.old_content)}
+            if edit.old_title != edit.new_title:
+                payload["title"] = edit.old_title
+        data = _pack(payload)
+        rows.append({
+            "note_id": edit.note_id,
+            "owner_id": owner_id,
+            "version": version,
+            "is_snapshot": snapshot,
+            "saved_at": edit.saved_at,
+            "size": len(data),
+            "data": data,
+        })
+    db.execute(insert(models.NoteRevision), rows)
+
+def delete_history(db: Session, note_ids: Iterable[int]) -> None:
+    note_ids = list(note_ids)
+    if note_ids:
+        db.execute(delete(models.NoteRevision).where(models.NoteRevision.note_id.in_(note_ids)))
+
+def list_revisions(db: Session, note_id: int, owner_id: int):
+    return db.execute(
+        select(
+            models.NoteRevision.version,
+            models.NoteRevision.saved_at,
+            models.NoteRevision.is_snapshot,
+            models.NoteRevision.size,
+        )
+        .where(models.NoteRevision.note_id == note_id, models.NoteRevision.owner_id == owner_id)
+        .order_by(models.NoteRevision.version.desc())
+    ).all()
+
+def reconstruct(db: Session, note_id: int, owner_id: int, version: int) -> dict | None:
+    """Rebuild ``version`` of a note from the nearest later snapshot, or the note itself."""
+    current = db.execute(
+        select(models.Note.title, models.Note.content, models.Note.created_at, models.Note.updated_at)
+        .where(models.Note.id == note_id, models.Note.owner_id == owner_id)
+    ).one_or_none()
+    if current is None:
+        return None
+    head = head_versions(db, [note_id])[note_id]
+    if version == head:
+        return {"title": current.title, "content": current.content, "saved_at": current.updated_at or current.created_at}
+    if not 1 <= version < head:
+        return None
+
+    revision = models.NoteRevision
+    snapshot = db.scalar(
+        select(func.min(revision.version))
+        .where(revision.note_id == note_id, revision.version >= version, revision.is_snapshot.is_(True))
+    )
+    rows = db.execute(
+        select(revision.version, revision.is_snapshot, revision.saved_at, revision.data)
+        .where(revision.note_id == note_id, revision.version.between(version, snapshot or head))
+        .order_by(revision.version.desc())
+    ).all()
+    title, content, saved_at = current.title, current.content, None
+    for row in rows:
+        payload = _unpack(row.data)
+        if row.is_snapshot:
+            title, content = payload["title"], payload["content"]
+        else:
+            title = payload.get("title", title)
+            content = apply_diff(content, payload["ops"])
+        saved_at = row.saved_at
+    return {"title": title, "content": content, "saved_at": saved_at}
@@ -0,0 +1,67 @@
+import os
+import secrets
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from fastapi.responses import PlainTextResponse
+
+from .. import auth, database
+from ..cache import note_cache
+from ..compression import compressed_cache
+from ..instrumentation import render_histograms
+
+# Off unless asked for: the endpoints reveal latency, SQL, pool and cache internals.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() in ("1", "true", "yes")
+# When set, scrapers must send "Authorization: Bearer <token>".
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+def require_metrics_token(authorization: Annotated[str | None, Header()] = None) -> None:
+    if METRICS_TOKEN and not secrets.compare_digest(authorization or "", f"Bearer {METRICS_TOKEN}"):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid metrics token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+router = APIRouter(
+    prefix="/metrics",
+    tags=["metrics"],
+    dependencies=[Depends(require_metrics_token)],
+)
+
+def _gauge(name: str, help_text: str, samples: list[tuple[str, float]], kind: str = "gauge") -> list[str]:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    lines += [f"{name}{{{labels}}} {value}" for labels, value in samples]
+    return lines
+
+@router.get("", response_class=PlainTextResponse)
+def read_prometheus_metrics():
+    """Request, SQL, pool and cache metrics in the Prometheus text format."""
+    pools = {"sync": database.pool_status(database.engine)}
+    if database.DATABASE_ASYNC:
+        pools["async"] = database.pool_status(database.async_engine.sync_engine)
+    lines = render_histograms()
+    for key, name, help_text, kind in (
+        ("checked_out", "db_pool_checked_out", "Connections currently checked out.", "gauge"),
+        ("overflow", "db_pool_overflow", "Overflow connections currently open.", "gauge"),
+        ("checkouts", "db_pool_checkouts_total", "Connection checkouts.", "counter"),
+        ("timeouts", "db_pool_timeouts_total", "Checkouts that timed out.", "counter"),
+        ("wait_seconds_total", "db_pool_wait_seconds_total", "Time spent waiting for a connection.", "counter"),
+    ):
+        samples = [(f'engine="{engine}"', status[key]) for engine, status in pools.items() if key in status]
+        lines += _gauge(name, help_text, samples, kind)
+    caches = read_cache_metrics()
+    lines += _gauge("cache_hits_total", "Cache hits.", [(f'cache="{name}"', stats["hits"]) for name, stats in caches.items()], "counter")
+    lines += _gauge("cache_misses_total", "Cache misses.", [(f'cache="{name}"', stats["misses"]) for name, stats in caches.items()], "counter")
+    return "\n".join(lines) + "\n"
+
+@router.get("/pool")
+def read_pool_metrics():
+    pools = {"sync": database.pool_status(database.engine)}
+    if database.DATABASE_ASYNC:
+        pools["async"] = database.pool_status(database.async_engine.sync_engine)
+    return pools
+
+@router.get("/cache")
+def read_cache_metrics():
+    return {"users": auth.user_cache.stats(), "notes": note_cache.stats(), "compressed": compressed_cache.stats()}
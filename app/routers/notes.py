@@ -1,82 +1,568 @@
-from datetime import datetime, timezone
-from typing import List, Annotated
+import zlib
+from typing import List, Annotated, Literal
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import bindparam, delete, func, insert, select, update
+from pydantic import ValidationError
 from sqlalchemy.orm import Session
 
-from .. import auth, models, schemas
-from ..database import get_db
+from .. import auth, etags, jobs, models, ndjson, ratelimit, revisions, schemas
+from ..cache import CachedResponse, note_cache
+from ..database import get_db, run_db
+from ..pagination import decode_cursor, encode_cursor
+from ..search import SearchNotSupported, search_notes
+from ..serialization import NOTE_COLUMNS, NOTE_FIELDS, SUMMARY_COLUMNS, encode_note, encode_notes, encode_rows, projection
+from ..sync import SyncPosition, changes_since, record_deletions
+
+BULK_MAX_ITEMS = 1000
+IMPORT_MAX_REPORTED_ERRORS = 100
 
 router = APIRouter(
     prefix="/notes",
     tags=["notes"],
-    dependencies=[Depends(auth.get_current_active_user)]
+    dependencies=[Depends(ratelimit.limit_user)]
 )
 
+def _get_owned_note_row(db: Session, note_id: int, owner_id: int):
+    return db.execute(
+        select(*NOTE_COLUMNS).where(models.Note.id == note_id, models.Note.owner_id == owner_id)
+    ).one_or_none()
+
+def _cached_json_response(cached: CachedResponse, if_none_match: str | None) -> Response:
+    if etags.etag_matches(if_none_match, cached.headers["ETag"], weak=True):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cached.headers)
+    return Response(content=cached.body, media_type="application/json", headers=cached.headers)
+
+def _lock_owned_note(db: Session, note_id: int, owner_id: int, *columns):
+    return db.execute(
+        select(models.Note.id, models.Note.created_at, models.Note.updated_at, *columns)
+        .where(models.Note.id == note_id, models.Note.owner_id == owner_id)
+        .with_for_update()
+    ).one_or_none()
+
+def _require_etag(current, if_match: str | None) -> None:
+    # Only the edit part counts: derived fields filled in since don't conflict with the client's change.
+    if if_match is not None and not etags.etag_matches(if_match, etags.note_etag(current), edit_only=True):
+        raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail="Note has been modified")
+
+def _apply_splices(content: str, splices: List[schemas.TextSplice]) -> str:
+    """Apply splices whose ranges all refer to ``content`` and do not overlap."""
+    ordered = sorted(splices, key=lambda splice: (splice.start, splice.end))
+    pieces, position = [], 0
+    for splice in ordered:
+        if splice.end < splice.start or splice.end > len(content) or splice.start < position:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_CONTENT, detail="Splice ranges are out of bounds or overlap")
+        pieces += [content[position:splice.start], splice.text]
+        position = splice.end
+    pieces.append(content[position:])
+    return "".join(pieces)
+
+def _check_if_match(db: Session, note_id: int, owner_id: int, if_match: str | None) -> bool:
+    """Lock the note and compare it to ``If-Match``; False when the note does not exist."""
+    if if_match is None:
+        return True
+    current = _lock_owned_note(db, note_id, owner_id)
+    if current is None:
+        return False
+    _require_etag(current, if_match)
+    return True
+
 @router.post("/", response_model=schemas.NoteInDB, status_code=status.HTTP_201_CREATED)
-def create_note_for_user(
+async def create_note_for_user(
     note: schemas.NoteCreate,
-    current_user: Annotated[models.User, Depends(auth.get_current_active_user)],
+    response: Response,
+    current_user_id: Annotated[int, Depends(auth.get_current_user_id)],
     db: Session = Depends(get_db)
 ):
-    db_note = models.Note(**note.model_dump(), owner_id=current_user.id)
-    db.add(db_note)
-    db.commit()
-    db.refresh(db_note)
+    def create(db: Session) -> models.Note:
+        db_note = models.Note(**note.model_dump(), owner_id=current_user_id)
+        db.add(db_note)
+        db.flush()
+        jobs.enqueue(db, current_user_id, [db_note.id])
+        db.commit()
+        db.refresh(db_note)
+        return db_note
+
+    db_note = await run_db(db, create)
+    note_cache.invalidate(current_user_id)
+    jobs.notify()
+    response.headers["ETag"] = etags.note_etag(db_note)
     return db_note
 
+@router.post("/bulk", response_model=List[schemas.NoteInDB], status_code=status.HTTP_201_CREATED)
+async def create_notes_bulk(
+    notes: Annotated[List[schemas.NoteCreate], Body(min_length=1, max_length=BULK_MAX_ITEMS)],
+    current_user_id: Annotated[int, Depends(auth.get_current_user_id)],
+    db: Session = Depends(get_db)
+):
+    """Create many notes with one multi-row ``INSERT ... RETURNING`` in a single transaction."""
+    def create_many(db: Session) -> List[schemas.NoteInDB]:
+        # SQLite can't order a batched RETURNING by parameter and would fall back to one
+        # INSERT per row; its ids are assigned in VALUES order, so sort by id instead.
+        ordered = db.get_bind().dialect.name != "sqlite"
+        rows = db.scalars(
+            insert(models.Note).returning(models.Note, sort_by_parameter_order=ordered),
+            [{**note.model_dump(), "owner_id": current_user_id} for note in notes],
+        ).all()
+        created = [schemas.NoteInDB.model_validate(row) for row in sorted(rows, key=lambda row: row.id)]
+        jobs.enqueue(db, current_user_id, [note.id for note in created])
+        db.commit()
+        return created
+
+    created = await run_db(db, create_many)
+    note_cache.invalidate(current_user_id)
+    jobs.notify()
+    return created
+
+@router.patch("/bulk", response_model=List[schemas.BulkItemResult])
+async def update_notes_bulk(
+    notes: Annotated[List[schemas.NoteBulkUpdate], Body(min_length=1, max_length=BULK_MAX_ITEMS)],
+    current_user_id: Annotated[int, Depends(auth.get_current_user_id)],
+    db: Session = Depends(get_db)
+):
+    """Apply partial updates to many notes in one transaction, reporting each id."""
+    ids = [note.id for note in notes]
+    if len(set(ids)) != len(ids):
+        raise HTTPException(status_code=400, detail="Duplicate note ids")
+
+    def update_many(db: Session) -> set[int]:
+        current = {row.id: row for row in db.execute(
+            select(models.Note.id, models.Note.title, models.Note.content, models.Note.created_at, models.Note.updated_at)
+            .where(models.Note.id.in_(ids), models.Note.owner_id == current_user_id)
+            .with_for_update()
+        )}
+        # One executemany per distinct set of changed fields, each stamping updated_at in the database.
+        groups: dict[tuple[str, ...], list[dict]] = {}
+        edits = []
+        for note in notes:
+            if note.id in current:
+                data = note.model_dump(exclude_unset=True, exclude={"id"})
+                groups.setdefault(tuple(sorted(data)), []).append(
+                    {"note_id": note.id, **{f"new_{key}": value for key, value in data.items()}}
+                )
+                old = current[note.id]
+                edits.append(revisions.Edit(
+                    note.id, old.updated_at or old.created_at, old.title, old.content,
+                    data.get("title", old.title), data.get("content", old.content),
+                ))
+        revisions.record_revisions(db, current_user_id, edits)
+        jobs.enqueue(db, current_user_id, [edit.note_id for edit in edits if edit.old_content != edit.new_content])
+        table = models.Note.__table__
+        for fields, rows in groups.items():
+            db.execute(
+                update(table)
+                .where(table.c.id == bindparam("note_id"))
+                .values({**{field: bindparam(f"new_{field}") for field in fields}, "updated_at": func.now()}),
+                rows,
+            )
+        db.commit()
+        return set(current)
+
+    owned = await run_db(db, update_many)
+    note_cache.invalidate(current_user_id, owned)
+    jobs.notify()
+    return [schemas.BulkItemResult(id=note_id, status="updated" if note_id in owned else "not_found") for note_id in ids]
+
+@router.delete("/bulk", response_model=List[schemas.BulkItemResult])
+async def delete_notes_bulk(
+    notes: schemas.NoteBulkDelete,
+    current_user_id: Annotated[int, Depends(auth.get_current_user_id)],
+    db: Session = Depends(get_db)
+):
+    """Delete many notes with one ``DELETE ... RETURNING``, reporting each id."""
+    def delete_many(db: Session) -> set[int]:
+        deleted = set(db.scalars(
+            delete(models.Note)
+            .where(models.Note.id.in_(notes.ids), models.Note.owner_id == current_user_id)
+            .returning(models.Note.id),
+            execution_options={"synchronize_session": False},
+        ))
+        record_deletions(db, current_user_id, deleted)
+        revisions.delete_history(db, deleted)
+        db.commit()
+        return deleted
+
+    deleted = await run_db(db, delete_many)
+    note_cache.invalidate(current_user_id, deleted)
+    return [schemas.BulkItemResult(id=note_id, status="deleted" if note_id in deleted else "not_found") for note_id in notes.ids]
+
+@router.post(
+    "/import",
+    response_model=schemas.NoteImportSummary,
+    responses={
+        status.HTTP_400_BAD_REQUEST: {"model": schemas.NoteImportSummary},
+        status.HTTP_413_CONTENT_TOO_LARGE: {"model": schemas.NoteImportSummary},
+    },
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/x-ndjson": {"schema": {"type": "string", "format": "binary"}}},
+        }
+    },
+)
+async def import_notes(
+    request: Request,
+    response: Response,
+    current_user_id: Annotated[int, Depends(auth.get_current_user_id)],
+    db: Session = Depends(get_db),
+    gzip: bool = False
+):
+    """Import notes from an NDJSON body, one ``NoteCreate`` object per line.
+
+    The body is read and validated as it streams in, and valid lines are
+    inserted in batches. Send ``Content-Encoding: gzip`` or ``?gzip=true``
+    for a compressed upload.
+
+    A line or body over the size limit (413) or a corrupt gzip stream (400)
+    stops the import. Every valid line before it is still inserted, and the
+    summary names the stopping line in ``aborted``, so a client can resume
+    after it instead of importing the same notes twice.
+    """
+    gzipped = gzip or request.headers.get("content-encoding", "").lower() == "gzip"
+    accepted, rejected, last_line = 0, 0, 0
+    errors: list[schemas.NoteImportLineError] = []
+    aborted: schemas.NoteImportLineError | None = None
+    batch: list[dict] = []
+    try:
+        try:
+            async for line_number, line in ndjson.aiter_lines(request.stream(), gzipped=gzipped):
+                last_line = line_number
+                try:
+                    note = schemas.NoteCreate.model_validate_json(line)
+                except ValidationError as exc:
+                    rejected += 1
+                    if len(errors) < IMPORT_MAX_REPORTED_ERRORS:
+                        errors.append(schemas.NoteImportLineError(line=line_number, error=exc.errors(include_url=False)[0]["msg"]))
+                    continue
+                batch.append({**note.model_dump(), "owner_id": current_user_id})
+                if len(batch) >= ndjson.IMPORT_BATCH_SIZE:
+                    await run_db(db, ndjson.insert_notes, batch)
+                    accepted += len(batch)
+                    batch = []
+        except (ndjson.LineTooLong, ndjson.BodyTooLarge) as exc:
+            response.status_code = status.HTTP_413_CONTENT_TOO_LARGE
+            aborted = schemas.NoteImportLineError(line=exc.line_number, error=str(exc))
+        except zlib.error:
+            response.status_code = status.HTTP_400_BAD_REQUEST
+            aborted = schemas.NoteImportLineError(line=last_line + 1, error="Invalid gzip body")
+        # Lines before a fatal error were read in full, so they are kept like any other.
+        if batch:
+            await run_db(db, ndjson.insert_notes, batch)
+            accepted += len(batch)
+    finally:
+        if accepted:
+            note_cache.invalidate(current_user_id)
+            jobs.notify()
+    return schemas.NoteImportSummary(accepted=accepted, rejected=rejected, errors=errors, aborted=aborted)
+
 @router.get("/", response_model=List[schemas.NoteInDB])
-def read_notes_for_user(
-    current_user: Annotated[models.User, Depends(auth.get_current_active_user)],
+async def read_notes_for_user(
+    current_user_id: Annotated[int, Depends(auth.get_current_user_id)],
     db: Session = Depends(get_db),
-    skip: int = 0,
-    limit: int = 100
+    skip: Annotated[int, Query(ge=0)] = 0,
+    limit: Annotated[int, Query(ge=1, le=1000)] = 100,
+    cursor: str | None = None,
+    view: Literal["full", "summary"] = "full",
+    fields: str | None = None,
+    if_none_match: Annotated[str | None, Header()] = None
 ):
-    notes = db.query(models.Note).filter(models.Note.owner_id == current_user.id).offset(skip).limit(limit).all()
-    return notes
+    """List notes ordered by id.
+
+    Pass the ``X-Next-Cursor`` header of a full page back as ``cursor`` to seek
+    past it on the ``(owner_id, id)`` index; ``skip`` remains for offset paging.
+
+    ``view=summary`` returns ``id``, ``title``, a ``preview`` of the content and
+    the timestamps instead of full notes; ``fields=id,title,...`` returns only
+    the listed fields. Either way unselected columns are never read.
+    """
+    if cursor is not None and skip:
+        raise HTTPException(status_code=400, detail="Use either cursor or skip, not both")
+    after_id = decode_cursor(cursor).get("id") if cursor is not None else None
+    if cursor is not None and not isinstance(after_id, int):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    columns, keys = NOTE_COLUMNS, None
+    if fields is not None:
+        if view != "full":
+            raise HTTPException(status_code=400, detail="Use either fields or view, not both")
+        requested = [field.strip() for field in fields.split(",") if field.strip()]
+        unknown = sorted(set(requested) - NOTE_FIELDS.keys())
+        if unknown or not requested:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+        columns, keys = projection(requested)
+    elif view == "summary":
+        columns, keys = SUMMARY_COLUMNS, [column.key for column in SUMMARY_COLUMNS]
+
+    def list_notes(db: Session):
+        query = select(*columns).where(models.Note.owner_id == current_user_id)
+        if after_id is not None:
+            query = query.where(models.Note.id > after_id)
+        return db.execute(query.order_by(models.Note.id).offset(skip).limit(limit)).all()
+
+    params = f"{skip}:{limit}:{cursor or ''}:{view}:{fields or ''}"
+    generation = note_cache.generation(current_user_id)
+    cached = note_cache.get_list(current_user_id, params, generation)
+    if cached is None:
+        notes = await run_db(db, list_notes)
+        headers = {"ETag": etags.collection_etag(notes)}
+        if notes and len(notes) == limit:
+            headers["X-Next-Cursor"] = encode_cursor({"id": notes[-1].id})
+        body = encode_notes(notes) if keys is None else encode_rows(notes, keys)
+        cached = CachedResponse(body, headers)
+        note_cache.set_list(current_user_id, params, cached, generation)
+    return _cached_json_response(cached, if_none_match)
+
+@router.get("/search", response_model=List[schemas.NoteSearchHit])
+async def search_notes_for_user(
+    response: Response,
+    current_user_id: Annotated[int, Depends(auth.get_current_user_id)],
+    q: Annotated[str, Query(min_length=1, max_length=256)],
+    db: Session = Depends(get_db),
+    limit: Annotated[int, Query(ge=1, le=100)] = 20,
+    cursor: str | None = None
+):
+    """Full-text search over title and content, best matches first.
+
+    Matches are highlighted with ``<mark>`` tags; page with ``X-Next-Cursor``
+    like the note list.
+    """
+    after = None
+    if cursor is not None:
+        position = decode_cursor(cursor)
+        if not isinstance(position.get("rank"), (int, float)) or not isinstance(position.get("id"), int):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        after = (float(position["rank"]), position["id"])
+
+    try:
+        hits = await run_db(db, search_notes, current_user_id, q, limit, after)
+    except SearchNotSupported:
+        raise HTTPException(status_code=501, detail="Search is not supported on this database")
+    if hits and len(hits) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor({"rank": hits[-1]["rank"], "id": hits[-1]["id"]})
+    return hits
+
+@router.get("/changes", response_model=schemas.NoteChanges)
+async def read_note_changes(
+    current_user_id: Annotated[int, Depends(auth.get_current_user_id)],
+    db: Session = Depends(get_db),
+    since: str | None = None,
+    limit: Annotated[int, Query(ge=1, le=1000)] = 500
+):
+    """Notes created, updated or deleted since the ``sync_token`` of a previous call.
+
+    Omit ``since`` for a full sync. While ``has_more`` is true, call again with
+    the returned token to drain the rest. Changes from the last
+    ``SYNC_OVERLAP_SECONDS`` before the token may be sent again; apply them by id.
+    """
+    position = None
+    if since is not None:
+        try:
+            position = SyncPosition.from_dict(decode_cursor(since))
+        except (KeyError, TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid sync token")
+
+    notes, deleted, new_position, has_more = await run_db(db, changes_since, current_user_id, position, limit)
+    return schemas.NoteChanges(
+        changed=[schemas.NoteInDB.model_validate(note) for note in notes],
+        deleted=deleted,
+        sync_token=encode_cursor(new_position.to_dict()),
+        has_more=has_more,
+    )
+
+@router.get("/export", response_class=StreamingResponse)
+async def export_notes(
+    current_user_id: Annotated[int, Depends(auth.get_current_user_id)],
+    db: Session = Depends(get_db),
+    gzip: bool = False
+):
+    """Stream every note as NDJSON, optionally gzipped, in constant memory."""
+    if isinstance(db, Session):
+        chunks = ndjson.iter_notes(db, current_user_id)
+        if gzip:
+            chunks = ndjson.gzip_chunks(chunks)
+    else:
+        chunks = ndjson.aiter_notes(db, current_user_id)
+        if gzip:
+            chunks = ndjson.agzip_chunks(chunks)
+    filename = "notes.ndjson.gz" if gzip else "notes.ndjson"
+    return StreamingResponse(
+        chunks,
+        media_type="application/gzip" if gzip else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
 
 @router.get("/{note_id}", response_model=schemas.NoteInDB)
-def read_note(
+async def read_note(
     note_id: int,
-    current_user: Annotated[models.User, Depends(auth.get_current_active_user)],
-    db: Session = Depends(get_db)
+    current_user_id: Annotated[int, Depends(auth.get_current_user_id)],
+    db: Session = Depends(get_db),
+    if_none_match: Annotated[str | None, Header()] = None
 ):
-    db_note = db.query(models.Note).filter(models.Note.id == note_id, models.Note.owner_id == current_user.id).first()
+    generation = note_cache.generation(current_user_id)
+    cached = note_cache.get_note(current_user_id, note_id)
+    if cached is None:
+        db_note = await run_db(db, _get_owned_note_row, note_id, current_user_id)
+        if db_note is None:
+            raise HTTPException(status_code=404, detail="Note not found")
+        cached = CachedResponse(encode_note(db_note), {"ETag": etags.note_etag(db_note)})
+        note_cache.set_note(current_user_id, note_id, cached, generation)
+    return _cached_json_response(cached, if_none_match)
+
+@router.put("/{note_id}", response_model=schemas.NoteInDB)
+async def update_note(
+    note_id: int,
+    note: schemas.NoteUpdate,
+    response: Response,
+    current_user_id: Annotated[int, Depends(auth.get_current_user_id)],
+    db: Session = Depends(get_db),
+    if_match: Annotated[str | None, Header()] = None
+):
+    def update_owned(db: Session) -> schemas.NoteInDB | None:
+        current = _lock_owned_note(db, note_id, current_user_id, models.Note.title, models.Note.content)
+        if current is None:
+            return None
+        _require_etag(current, if_match)
+        db_note = db.scalars(
+            update(models.Note)
+            .where(models.Note.id == note_id, models.Note.owner_id == current_user_id)
+            .values(**note.model_dump(exclude_unset=True), updated_at=func.now())
+            .returning(models.Note),
+            execution_options={"synchronize_session": False, "populate_existing": True},
+        ).one_or_none()
+        if db_note is None:
+            # Deleted since it was read; SQLite has no row locks to prevent that.
+            return None
+        updated = schemas.NoteInDB.model_validate(db_note)
+        revisions.record_revisions(db, current_user_id, [revisions.Edit(
+            note_id, current.updated_at or current.created_at, current.title, current.content, updated.title, updated.content
+        )])
+        if updated.content != current.content:
+            jobs.enqueue(db, current_user_id, [note_id])
+        db.commit()
+        return updated
+
+    db_note = await run_db(db, update_owned)
     if db_note is None:
         raise HTTPException(status_code=404, detail="Note not found")
+    note_cache.invalidate(current_user_id, [note_id])
+    jobs.notify()
+    response.headers["ETag"] = etags.note_etag(db_note)
     return db_note
 
-@router.put("/{note_id}", response_model=schemas.NoteInDB)
-def update_note(
+@router.patch("/{note_id}", response_model=schemas.NoteInDB)
+async def patch_note(
     note_id: int,
-    note: schemas.NoteUpdate,
-    current_user: Annotated[models.User, Depends(auth.get_current_active_user)],
-    db: Session = Depends(get_db)
+    patch: schemas.NotePatch,
+    response: Response,
+    current_user_id: Annotated[int, Depends(auth.get_current_user_id)],
+    db: Session = Depends(get_db),
+    if_match: Annotated[str | None, Header()] = None
 ):
-    db_note = db.query(models.Note).filter(models.Note.id == note_id, models.Note.owner_id == current_user.id).first()
+    """Edit a note in place by splicing text ranges, without sending the whole content.
+
+    Splice offsets refer to the version named by ``If-Match``, which is
+    required and must be a concrete ETag; ``*`` would apply the offsets to
+    whatever version is current. A stale ETag gets 412 and the client must
+    rebase its edits.
+    """
+    if if_match is None:
+        raise HTTPException(status_code=status.HTTP_428_PRECONDITION_REQUIRED, detail="If-Match header required")
+    if any(candidate.strip() == "*" for candidate in if_match.split(",")):
+        raise HTTPException(status_code=status.HTTP_428_PRECONDITION_REQUIRED, detail="If-Match must name a specific version")
+
+    def patch_owned(db: Session) -> schemas.NoteInDB | None:
+        current = _lock_owned_note(db, note_id, current_user_id, models.Note.title, models.Note.content)
+        if current is None:
+            return None
+        _require_etag(current, if_match)
+        title = patch.title if patch.title is not None else current.title
+        content = _apply_splices(current.content, patch.splices)
+        if not content:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_CONTENT, detail="Content cannot be empty")
+        db_note = db.scalars(
+            update(models.Note)
+            .where(models.Note.id == note_id, models.Note.owner_id == current_user_id)
+            .values(title=title, content=content, updated_at=func.now())
+            .returning(models.Note),
+            execution_options={"synchronize_session": False, "populate_existing": True},
+        ).one_or_none()
+        if db_note is None:
+            return None
+        updated = schemas.NoteInDB.model_validate(db_note)
+        revisions.record_revisions(db, current_user_id, [revisions.Edit(
+            note_id, current.updated_at or current.created_at, current.title, current.content, title, content
+        )])
+        if content != current.content:
+            jobs.enqueue(db, current_user_id, [note_id])
+        db.commit()
+        return updated
+
+    db_note = await run_db(db, patch_owned)
     if db_note is None:
         raise HTTPException(status_code=404, detail="Note not found")
-    
-    update_data = note.model_dump(exclude_unset=True)
-    for key, value in update_data.items():
-        setattr(db_note, key, value)
-    
-    db_note.updated_at = datetime.now(timezone.utc)
-    db.add(db_note)
-    db.commit()
-    db.refresh(db_note)
+    note_cache.invalidate(current_user_id, [note_id])
+    jobs.notify()
+    response.headers["ETag"] = etags.note_etag(db_note)
     return db_note
 
 @router.delete("/{note_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_note(
+async def delete_note(
     note_id: int,
-    current_user: Annotated[models.User, Depends(auth.get_current_active_user)],
-    db: Session = Depends(get_db)
+    current_user_id: Annotated[int, Depends(auth.get_current_user_id)],
+    db: Session = Depends(get_db),
+    if_match: Annotated[str | None, Header()] = None
 ):
-    db_note = db.query(models.Note).filter(models.Note.id == note_id, models.Note.owner_id == current_user.id).first()
-    if db_note is None:
+    def delete_owned(db: Session) -> bool:
+        if not _check_if_match(db, note_id, current_user_id, if_match):
+            return False
+        deleted_id = db.scalar(
+            delete(models.Note)
+            .where(models.Note.id == note_id, models.Note.owner_id == current_user_id)
+            .returning(models.Note.id),
+            execution_options={"synchronize_session": False},
+        )
+        if deleted_id is not None:
+            record_deletions(db, current_user_id, [deleted_id])
+            revisions.delete_history(db, [deleted_id])
+        db.commit()
+        return deleted_id is not None
+
+    if not await run_db(db, delete_owned):
         raise HTTPException(status_code=404, detail="Note not found")
-    
-    db.delete(db_note)
-    db.commit()
+    note_cache.invalidate(current_user_id, [note_id])
     return None
+
+@router.get("/{note_id}/revisions", response_model=List[schemas.NoteRevisionInfo])
+async def list_note_revisions(
+    note_id: int,
+    current_user_id: Annotated[int, Depends(auth.get_current_user_id)],
+    db: Session = Depends(get_db)
+):
+    """Previous versions of a note, newest first. The note itself is the version after the first one listed."""
+    def list_owned(db: Session):
+        owned = db.scalar(select(models.Note.id).where(models.Note.id == note_id, models.Note.owner_id == current_user_id))
+        if owned is None:
+            return None
+        return revisions.list_revisions(db, note_id, current_user_id)
+
+    rows = await run_db(db, list_owned)
+    if rows is None:
+        raise HTTPException(status_code=404, detail="Note not found")
+    return [
+        schemas.NoteRevisionInfo(version=row.version, saved_at=row.saved_at, snapshot=row.is_snapshot, size=row.size)
+        for row in rows
+    ]
+
+@router.get("/{note_id}/revisions/{version}", response_model=schemas.NoteVersion)
+async def read_note_revision(
+    note_id: int,
+    version: int,
+    current_user_id: Annotated[int, Depends(auth.get_current_user_id)],
+    db: Session = Depends(get_db)
+):
+    """Rebuild a note as it was at ``version``, counting from 1 for the text it was created with."""
+    state = await run_db(db, revisions.reconstruct, note_id, current_user_id, version)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Revision not found")
+    return schemas.NoteVersion(id=note_id, version=version, **state)
@@ -5,33 +5,42 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 
-from .. import auth, models, schemas
-from ..database import get_db
+from .. import auth, models, ratelimit, schemas, tokens
+from ..database import get_db, run_db
 
 router = APIRouter(
     prefix="/users",
     tags=["users"],
 )
 
-@router.post("/register", response_model=schemas.UserInDB, status_code=status.HTTP_201_CREATED)
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = auth.get_user(db, email=user.email)
+@router.post(
+    "/register",
+    response_model=schemas.UserInDB,
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(ratelimit.limit_register)],
+)
+async def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+    db_user = await run_db(db, auth.get_user, email=user.email)
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
         
-    hashed_password = auth.get_password_hash(user.password)
-    db_user = models.User(email=user.email, hashed_password=hashed_password, username=user.username)
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
-    return db_user
-
-@router.post("/token", response_model=schemas.Token)
+    hashed_password = await auth.get_password_hash_async(user.password)
+
+    def insert_user(db: Session) -> models.User:
+        db_user = models.User(email=user.email, hashed_password=hashed_password, username=user.username)
+        db.add(db_user)
+        db.commit()
+        db.refresh(db_user)
+        return db_user
+
+    return await run_db(db, insert_user)
+
+@router.post("/token", response_model=schemas.Token, dependencies=[Depends(ratelimit.limit_login)])
 async def login_for_access_token(
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()], db: Session = Depends(get_db)
 ):
-    user = auth.authenticate_user(db, identifier=form_data.username, password=form_data.password)
-    if not user or not auth.verify_password(form_data.password, user.hashed_password):
+    user = await auth.authenticate_user(db, identifier=form_data.username, password=form_data.password)
+    if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -40,10 +49,60 @@ async def login_for_access_token(
         
     access_token_expires = timedelta(minutes=auth.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = auth.create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
+        data=auth.token_claims(user), expires_delta=access_token_expires
     )
-    return {"access_token": access_token, "token_type": "bearer"}
+
+    def issue(db: Session) -> str:
+        refresh_token = tokens.issue_refresh_token(db, user.id)
+        db.commit()
+        return refresh_token
+
+    refresh_token = await run_db(db, issue)
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
+
+@router.post("/token/refresh", response_model=schemas.Token)
+async def refresh_access_token(body: schemas.TokenRefresh, db: Session = Depends(get_db)):
+    """Exchange a refresh token for a new access token and a new refresh token.
+
+    No password hashing is involved. Each refresh token works once; presenting a
+    spent one revokes every token descended from the same login.
+    """
+    def rotate(db: Session) -> tuple[dict, str]:
+        user, refresh_token = tokens.rotate_refresh_token(db, body.refresh_token)
+        return auth.token_claims(user), refresh_token
+
+    try:
+        claims, refresh_token = await run_db(db, rotate)
+    except tokens.InvalidRefreshToken:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    access_token = auth.create_access_token(
+        data=claims, expires_delta=timedelta(minutes=auth.ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
+
+@router.post("/token/revoke", status_code=status.HTTP_204_NO_CONTENT)
+async def revoke_tokens(
+    token: Annotated[str, Depends(auth.oauth2_scheme)],
+    current_user_id: Annotated[int, Depends(auth.get_current_user_id)],
+    body: schemas.TokenRevoke | None = None,
+    db: Session = Depends(get_db),
+):
+    """Log out: revoke the access token used for this call and, if given, the refresh token's family."""
+    token_data = auth.decode_access_token(token)
+
+    def revoke(db: Session) -> None:
+        if token_data.jti is not None and token_data.expires_at is not None:
+            tokens.revoke_access_token(db, token_data.jti, token_data.expires_at)
+        if body is not None and body.refresh_token:
+            tokens.revoke_refresh_token(db, body.refresh_token, current_user_id)
+        db.commit()
+
+    await run_db(db, revoke)
 
 @router.get("/me", response_model=schemas.UserInDB)
-async def read_users_me(current_user: Annotated[models.User, Depends(auth.get_current_active_user)]):
+async def read_users_me(current_user: Annotated[schemas.UserInDB, Depends(auth.get_current_active_user)]):
     return current_user
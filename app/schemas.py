@@ -5,9 +5,19 @@ from datetime import datetime
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: str | None = None
 
 class TokenData(BaseModel):
     email: str | None = None
+    user_id: int | None = None
+    jti: str | None = None
+    expires_at: datetime | None = None
+
+class TokenRefresh(BaseModel):
+    refresh_token: str
+
+class TokenRevoke(BaseModel):
+    refresh_token: str | None = None
 
 # User Schema
 class UserBase(BaseModel):
@@ -34,6 +44,26 @@ class NoteUpdate(BaseModel):
     title: str | None = Field(None, min_length=1, max_length=100)
     content: str | None = Field(None, min_length=1)
 
+class NoteBulkUpdate(NoteUpdate):
+    id: int
+
+class TextSplice(BaseModel):
+    """Replace ``content[start:end]`` of the base version with ``text``; offsets count code points."""
+    start: int = Field(..., ge=0)
+    end: int = Field(..., ge=0)
+    text: str = ""
+
+class NotePatch(BaseModel):
+    title: str | None = Field(None, min_length=1, max_length=100)
+    splices: list[TextSplice] = Field(default_factory=list, max_length=1000)
+
+class NoteBulkDelete(BaseModel):
+    ids: list[int] = Field(..., min_length=1, max_length=1000)
+
+class BulkItemResult(BaseModel):
+    id: int
+    status: str
+
 class NoteInDB(NoteBase):
     model_config = ConfigDict(from_attributes=True)
 
@@ -41,3 +71,39 @@ class NoteInDB(NoteBase):
     owner_id: int
     created_at: datetime
     updated_at: datetime | None = None
+    word_count: int | None = None
+
+class NoteSearchHit(NoteInDB):
+    rank: float
+    title_highlight: str
+    snippet: str
+
+class NoteChanges(BaseModel):
+    changed: list[NoteInDB]
+    deleted: list[int]
+    sync_token: str
+    has_more: bool
+
+class NoteImportLineError(BaseModel):
+    line: int
+    error: str
+
+class NoteImportSummary(BaseModel):
+    accepted: int
+    rejected: int
+    errors: list[NoteImportLineError]
+    # The error that stopped the import early; no line from it onwards was read.
+    aborted: NoteImportLineError | None = None
+
+class NoteRevisionInfo(BaseModel):
+    version: int
+    saved_at: datetime | None
+    snapshot: bool
+    size: int
+
+class NoteVersion(BaseModel):
+    id: int
+    version: int
+    title: str
+    content: str
+    saved_at: datetime | None
@@ -0,0 +1,80 @@
+from sqlalchemy import DateTime, Float, Integer, String, column, text
+from sqlalchemy.orm import Session
+
+# Keyset over (rank DESC, id): the inner query ranks and pages, highlighting
+# only runs on the rows that survive the limit.
+_POSTGRES_SEARCH = """
+SELECT hits.*,
+       ts_headline('english', hits.title, websearch_to_tsquery('english', :q),
+                   'StartSel=<mark>, StopSel=</mark>, HighlightAll=true') AS title_highlight,
+       ts_headline('english', hits.content, websearch_to_tsquery('english', :q),
+                   'StartSel=<mark>, StopSel=</mark>, MaxFragments=2, MaxWords=20, MinWords=5') AS snippet
+FROM (
+    SELECT n.id, n.title, n.content, n.owner_id, n.created_at, n.updated_at, n.word_count,
+           ts_rank(n.search_vector, query)::float8 AS rank
+    FROM notes n, websearch_to_tsquery('english', :q) AS query
+    WHERE n.owner_id = :owner_id AND n.search_vector @@ query
+) AS hits
+WHERE CAST(:after_rank AS float8) IS NULL OR hits.rank < :after_rank OR (hits.rank = :after_rank AND hits.id > :after_id)
+ORDER BY hits.rank DESC, hits.id
+LIMIT :limit
+"""
+
+_SQLITE_SEARCH = """
+SELECT * FROM (
+    SELECT n.id, n.title, n.content, n.owner_id, n.created_at, n.updated_at, n.word_count,
+           -bm25(notes_fts, 10.0, 1.0) AS rank,
+           highlight(notes_fts, 0, '<mark>', '</mark>') AS title_highlight,
+           snippet(notes_fts, 1, '<mark>', '</mark>', '...', 20) AS snippet
+    FROM notes_fts JOIN notes n ON n.id = notes_fts.rowid
+    WHERE notes_fts MATCH :q AND n.owner_id = :owner_id
+) AS hits
+WHERE :after_rank IS NULL OR hits.rank < :after_rank OR (hits.rank = :after_rank AND hits.id > :after_id)
+ORDER BY hits.rank DESC, hits.id
+LIMIT :limit
+"""
+
+_RESULT_COLUMNS = (
+    column("id", Integer),
+    column("title", String),
+    column("content", String),
+    column("owner_id", Integer),
+    column("created_at", DateTime(timezone=True)),
+    column("updated_at", DateTime(timezone=True)),
+    column("word_count", Integer),
+    column("rank", Float),
+    column("title_highlight", String),
+    column("snippet", String),
+)
+
+class SearchNotSupported(Exception):
+    pass
+
+def _fts5_query(q: str) -> str:
+    # Quote every term so user input is matched literally rather than parsed as FTS5 syntax.
+    return " ".join('"' + term.replace('"', '""') + '"' for term in q.split())
+
+def search_notes(
+    db: Session,
+    owner_id: int,
+    q: str,
+    limit: int,
+    after: tuple[float, int] | None = None,
+) -> list[dict]:
+    """Return ranked, highlighted matches for ``q`` among the owner's notes."""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        statement, query = _POSTGRES_SEARCH, q
+    elif dialect == "sqlite":
+        statement, query = _SQLITE_SEARCH, _fts5_query(q)
+    else:
+        raise SearchNotSupported(dialect)
+    if not query:
+        return []
+
+    after_rank, after_id = after if after is not None else (None, None)
+    result = db.execute(
+        text(statement).columns(*_RESULT_COLUMNS),
+        {"q": query, "owner_id": owner_id, "limit": limit, "after_rank": after_rank, "after_id": after_id},
+    )
+    return [dict(row) for row in result.mappings()]
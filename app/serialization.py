@@ -0,0 +1,71 @@
+import json
+import os
+from typing import Any, List, Sequence
+
+from pydantic import TypeAdapter
+from sqlalchemy import func
+
+from . import models, schemas
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+FAST_JSON_RESPONSES = os.getenv("FAST_JSON_RESPONSES", "true").lower() in ("1", "true", "yes")
+NOTE_PREVIEW_LENGTH = int(os.getenv("NOTE_PREVIEW_LENGTH", 200))
+
+# Columns behind schemas.NoteInDB, selected as plain tuples for the read paths.
+NOTE_COLUMNS = (
+    models.Note.id,
+    models.Note.title,
+    models.Note.content,
+    models.Note.owner_id,
+    models.Note.created_at,
+    models.Note.updated_at,
+    models.Note.word_count,
+)
+
+NOTE_FIELDS = {column.key: column for column in NOTE_COLUMNS}
+
+# The summary view cuts the preview in SQL so full bodies never leave the database.
+SUMMARY_COLUMNS = (
+    models.Note.id,
+    models.Note.title,
+    func.substr(models.Note.content, 1, NOTE_PREVIEW_LENGTH).label("preview"),
+    models.Note.created_at,
+    models.Note.updated_at,
+)
+
+# Selected with every projection so ETags and cursors can still be computed.
+_VERSION_COLUMNS = (models.Note.id, models.Note.created_at, models.Note.updated_at)
+
+_note_adapter = TypeAdapter(schemas.NoteInDB)
+_note_list_adapter = TypeAdapter(List[schemas.NoteInDB])
+
+def dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        # OPT_UTC_Z matches Pydantic's rendering of UTC datetimes.
+        return orjson.dumps(obj, option=orjson.OPT_UTC_Z)
+    return json.dumps(obj, default=lambda value: value.isoformat(), separators=(",", ":")).encode()
+
+def encode_note(row: Any) -> bytes:
+    """JSON for one ``NOTE_COLUMNS`` row (or ORM note), shaped like ``NoteInDB``."""
+    if FAST_JSON_RESPONSES:
+        return dumps({column.key: getattr(row, column.key) for column in NOTE_COLUMNS})
+    return _note_adapter.dump_json(_note_adapter.validate_python(row, from_attributes=True))
+
+def encode_notes(rows: Sequence[Any]) -> bytes:
+    if FAST_JSON_RESPONSES:
+        keys = [column.key for column in NOTE_COLUMNS]
+        return dumps([dict(zip(keys, row)) for row in rows])
+    return _note_list_adapter.dump_json(_note_list_adapter.validate_python(rows, from_attributes=True))
+
+def projection(fields: Sequence[str]) -> tuple[list, list[str]]:
+    """Columns to select and keys to emit for a ``fields=`` selection; ``id`` is always emitted."""
+    keys = ["id"] + [field for field in fields if field != "id"]
+    columns = list(_VERSION_COLUMNS) + [NOTE_FIELDS[key] for key in keys if key not in ("id", "created_at", "updated_at")]
+    return columns, keys
+
+def encode_rows(rows: Sequence[Any], keys: Sequence[str]) -> bytes:
+    return dumps([{key: getattr(row, key) for key in keys} for row in rows])
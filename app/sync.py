@@ -0,0 +1,119 @@
+import os
+from datetime import datetime, timedelta
+from typing import Iterable
+
+from sqlalchemy import DateTime, and_, func, insert, or_, select
+from sqlalchemy.orm import Session
+
+from . import models
+
+# changed_at and deleted_at come from now(), which on PostgreSQL is the start of
+# the writing transaction, so a row can commit with a timestamp below a position
+# that was already handed out. Each sync re-reads this many seconds before its
+# position; it must exceed the longest write transaction.
+SYNC_OVERLAP_SECONDS = float(os.getenv("SYNC_OVERLAP_SECONDS", 30))
+
+class SyncPosition:
+    """Where a client's last sync stopped: the (changed_at, id) of the last note
+    it received, the (deleted_at, note id) of the last tombstone, and whether
+    the previous page said there was more to drain."""
+
+    def __init__(
+        self,
+        changed_at: datetime | None = None,
+        note_id: int = 0,
+        deleted_at: datetime | None = None,
+        deleted_id: int = 0,
+        more: bool = False,
+    ):
+        self.changed_at = changed_at
+        self.note_id = note_id
+        self.deleted_at = deleted_at
+        self.deleted_id = deleted_id
+        self.more = more
+
+    def to_dict(self) -> dict:
+        return {
+            "u": self.changed_at.isoformat() if self.changed_at else None,
+            "i": self.note_id,
+            "d": self.deleted_at.isoformat() if self.deleted_at else None,
+            "t": self.deleted_id,
+            "m": self.more,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "SyncPosition":
+        """Raises ValueError or TypeError when ``data`` is not a position."""
+        changed_at, note_id, deleted_at = data["u"], data["i"], data["d"]
+        # Tokens issued before tombstone paging lack "t" and "m".
+        deleted_id, more = data.get("t", 0), data.get("m", False)
+        if not isinstance(note_id, int) or not isinstance(deleted_id, int):
+            raise TypeError("note id must be an integer")
+        if not isinstance(more, bool):
+            raise TypeError("more must be a boolean")
+        return cls(
+            changed_at=datetime.fromisoformat(changed_at) if changed_at is not None else None,
+            note_id=note_id,
+            deleted_at=datetime.fromisoformat(deleted_at) if deleted_at is not None else None,
+            deleted_id=deleted_id,
+            more=more,
+        )
+
+def record_deletions(db: Session, owner_id: int, note_ids: Iterable[int]) -> None:
+    rows = [{"note_id": note_id, "owner_id": owner_id} for note_id in note_ids]
+    if rows:
+        db.execute(insert(models.NoteTombstone), rows)
+
+def _after(column, id_column, at: datetime, last_id: int, overlap: bool):
+    """Rows past the keyset position ``(at, last_id)``, or from ``SYNC_OVERLAP_SECONDS`` before it."""
+    if overlap and SYNC_OVERLAP_SECONDS > 0:
+        return column >= at - timedelta(seconds=SYNC_OVERLAP_SECONDS)
+    return or_(column > at, and_(column == at, id_column > last_id))
+
+def changes_since(
+    db: Session, owner_id: int, position: SyncPosition | None, limit: int
+) -> tuple[list[models.Note], list[int], SyncPosition, bool]:
+    """Return notes changed and ids deleted after ``position``, plus the new position.
+
+    Notes are read in ``(changed_at, id)`` order along ``ix_notes_owner_id_changed_at``
+    and tombstones in ``(deleted_at, note_id)`` order, each ``limit`` rows at a
+    time, so a large backlog is drained over several calls. The first page of
+    each sync starts ``SYNC_OVERLAP_SECONDS`` early to catch late commits, so
+    clients see some notes and deletions again and must apply them by id.
+    """
+    # Follow-up pages continue exactly where the previous one stopped; only a
+    # fresh sync needs the overlap, and skipping it there guarantees progress.
+    overlap = position is not None and not position.more
+
+    query = db.query(models.Note).filter(models.Note.owner_id == owner_id)
+    if position is not None and position.changed_at is not None:
+        query = query.filter(_after(models.Note.changed_at, models.Note.id, position.changed_at, position.note_id, overlap))
+    notes = query.order_by(models.Note.changed_at, models.Note.id).limit(limit + 1).all()
+    has_more = len(notes) > limit
+    notes = notes[:limit]
+
+    deleted: list[int] = []
+    deleted_at = position.deleted_at if position is not None else None
+    deleted_id = position.deleted_id if position is not None else 0
+    if position is None:
+        # A first sync has nothing to delete; start tracking tombstones from now.
+        deleted_at = db.scalar(select(func.now(type_=DateTime(timezone=True))))
+    else:
+        tombstone = models.NoteTombstone
+        tombstones = select(tombstone.note_id, tombstone.deleted_at).where(tombstone.owner_id == owner_id)
+        if deleted_at is not None:
+            tombstones = tombstones.where(_after(tombstone.deleted_at, tombstone.note_id, deleted_at, deleted_id, overlap))
+        rows = db.execute(tombstones.order_by(tombstone.deleted_at, tombstone.note_id).limit(limit + 1)).all()
+        has_more = has_more or len(rows) > limit
+        for note_id, tombstone_deleted_at in rows[:limit]:
+            deleted.append(note_id)
+            deleted_at, deleted_id = tombstone_deleted_at, note_id
+        deleted = list(dict.fromkeys(deleted))
+
+    if notes:
+        changed_at, note_id = notes[-1].changed_at, notes[-1].id
+    elif position is not None:
+        changed_at, note_id = position.changed_at, position.note_id
+    else:
+        changed_at, note_id = None, 0
+    return notes, deleted, SyncPosition(changed_at, note_id, deleted_at, deleted_id, has_more), has_more
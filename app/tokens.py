@@ -0,0 +1,127 @@
+import hashlib
+import os
+import secrets
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.orm import Session
+
+from . import models
+
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", 30))
+# How stale a worker's copy of the revocation list may get before it reloads from the database.
+REVOCATION_SYNC_SECONDS = float(os.getenv("REVOCATION_SYNC_SECONDS", 10))
+
+class InvalidRefreshToken(Exception):
+    pass
+
+def _digest(token: str) -> str:
+    # Refresh tokens are 256 random bits, so a fast hash is enough; bcrypt would defeat the point.
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def issue_refresh_token(db: Session, user_id: int, family_id: str | None = None) -> str:
+    """Store a new refresh token for ``user_id`` and return it. The caller commits."""
+    token = secrets.token_urlsafe(32)
+    db.add(models.RefreshToken(
+        token_hash=_digest(token),
+        family_id=family_id or uuid.uuid4().hex,
+        user_id=user_id,
+        expires_at=datetime.now(timezone.utc) + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+    ))
+    return token
+
+def rotate_refresh_token(db: Session, token: str) -> tuple[models.User, str]:
+    """Spend ``token`` and issue its successor in the same family.
+
+    A token that was already spent means it leaked: the whole family is revoked
+    so neither the thief nor the legitimate client can keep refreshing.
+    """
+    now = datetime.now(timezone.utc)
+    stored = db.scalars(
+        select(models.RefreshToken)
+        .where(models.RefreshToken.token_hash == _digest(token), models.RefreshToken.expires_at > now)
+        .with_for_update()
+    ).one_or_none()
+    if stored is None:
+        raise InvalidRefreshToken()
+    if stored.revoked_at is not None:
+        revoke_refresh_family(db, stored.family_id)
+        db.commit()
+        raise InvalidRefreshToken()
+
+    stored.revoked_at = now
+    user = db.get(models.User, stored.user_id)
+    if user is None:
+        raise InvalidRefreshToken()
+    new_token = issue_refresh_token(db, user.id, stored.family_id)
+    db.commit()
+    return user, new_token
+
+def revoke_refresh_family(db: Session, family_id: str) -> None:
+    db.execute(
+        update(models.RefreshToken)
+        .where(models.RefreshToken.family_id == family_id, models.RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=datetime.now(timezone.utc))
+    )
+
+def revoke_refresh_token(db: Session, token: str, user_id: int) -> None:
+    family_id = db.scalar(
+        select(models.RefreshToken.family_id).where(
+            models.RefreshToken.token_hash == _digest(token), models.RefreshToken.user_id == user_id
+        )
+    )
+    if family_id is not None:
+        revoke_refresh_family(db, family_id)
+
+class RevocationList:
+    """Revoked access token ids, checked in memory on every authenticated request.
+
+    Each worker keeps its own copy and reloads it from ``revoked_tokens`` every
+    ``sync_interval`` seconds, so a revocation made on another worker takes
+    effect within that interval. Entries drop out once the token has expired.
+    """
+
+    def __init__(self, sync_interval: float):
+        self.sync_interval = sync_interval
+        self._expiries: dict[str, float] = {}
+        self._synced_at = float("-inf")
+        self._lock = threading.Lock()
+
+    def __contains__(self, jti: str) -> bool:
+        return jti in self._expiries
+
+    def add(self, jti: str, expires_at: datetime) -> None:
+        with self._lock:
+            self._expiries[jti] = expires_at.timestamp()
+
+    def needs_sync(self) -> bool:
+        return time.monotonic() - self._synced_at >= self.sync_interval
+
+    def sync(self, db: Session) -> None:
+        # Claim the slot first so concurrent requests don't all reload at once.
+        self._synced_at = time.monotonic()
+        now = datetime.now(timezone.utc)
+        rows = db.execute(
+            select(models.RevokedToken.jti, models.RevokedToken.expires_at).where(models.RevokedToken.expires_at > now)
+        ).all()
+        loaded = {jti: expires_at.replace(tzinfo=expires_at.tzinfo or timezone.utc).timestamp() for jti, expires_at in rows}
+        with self._lock:
+            live = {jti: expiry for jti, expiry in self._expiries.items() if expiry > now.timestamp()}
+            self._expiries = {**live, **loaded}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._expiries = {}
+            self._synced_at = time.monotonic()
+
+revoked_access_tokens = RevocationList(sync_interval=REVOCATION_SYNC_SECONDS)
+
+def revoke_access_token(db: Session, jti: str, expires_at: datetime) -> None:
+    """Deny ``jti`` until ``expires_at`` and prune rows that are no longer needed. The caller commits."""
+    db.execute(delete(models.RevokedToken).where(models.RevokedToken.expires_at <= datetime.now(timezone.utc)))
+    if db.get(models.RevokedToken, jti) is None:
+        db.add(models.RevokedToken(jti=jti, expires_at=expires_at))
+    revoked_access_tokens.add(jti, expires_at)
@@ -0,0 +1,29 @@
+"""Run the note job queue in its own process.
+
+    JOBS_IN_PROCESS=false uvicorn main:app --workers 4
+    python -m app.worker
+
+Any number of these can run alongside the API; jobs are claimed with
+``SKIP LOCKED`` so each runs once.
+"""
+import asyncio
+import logging
+import signal
+
+from . import jobs
+
+async def run() -> None:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    jobs.logger.info("job worker started")
+    await jobs.worker(stop)
+
+def main() -> int:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    asyncio.run(run())
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,239 @@
+"""Load-test the Notes API and report throughput and latency per endpoint.
+
+Runs in-process against the ASGI app (SQLite by default, or whatever
+DATABASE_URL points at), or against a running server with --base-url:
+
+    python -m benchmarks.run --users 10 --notes 200 --concurrency 32 --duration 30
+    python -m benchmarks.run --base-url http://localhost:8000 --output baseline.json
+    python -m benchmarks.run --compare baseline.json --tolerance 0.2
+
+With --compare the exit status is 1 when any endpoint's p95 latency grew,
+or its throughput fell, by more than the tolerance.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import time
+import uuid
+from collections import defaultdict
+
+import httpx
+
+# Weighted operation mix; read-heavy like production traffic.
+DEFAULT_MIX = {
+    "login": 1,
+    "create": 10,
+    "list": 30,
+    "get": 30,
+    "update": 10,
+    "delete": 4,
+    "search": 15,
+}
+
+WORDS = "alpha bravo charlie delta echo foxtrot golf hotel india juliet kilo lima mike".split()
+
+class VirtualUser:
+    def __init__(self, email: str, password: str):
+        self.email = email
+        self.password = password
+        self.headers: dict[str, str] = {}
+        self.note_ids: list[int] = []
+
+def _text(words: int) -> str:
+    return " ".join(random.choice(WORDS) for _ in range(words))
+
+def _percentile(sorted_values: list[float], percent: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, round(percent / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+class Recorder:
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+
+    def record(self, name: str, seconds: float, ok: bool) -> None:
+        self.latencies[name].append(seconds)
+        if not ok:
+            self.errors[name] += 1
+
+    def report(self, elapsed: float) -> dict:
+        endpoints = {}
+        for name, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            endpoints[name] = {
+                "count": len(values),
+                "errors": self.errors[name],
+                "rps": round(len(values) / elapsed, 2),
+                "p50_ms": round(_percentile(values, 50) * 1000, 3),
+                "p95_ms": round(_percentile(values, 95) * 1000, 3),
+                "p99_ms": round(_percentile(values, 99) * 1000, 3),
+            }
+        return endpoints
+
+async def _login(client: httpx.AsyncClient, user: VirtualUser) -> httpx.Response:
+    response = await client.post("/users/token", data={"username": user.email, "password": user.password})
+    if response.status_code == 200:
+        user.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    return response
+
+async def seed(client: httpx.AsyncClient, users: int, notes: int) -> list[VirtualUser]:
+    run_id = uuid.uuid4().hex[:8]
+    seeded = []
+    for i in range(users):
+        user = VirtualUser(f"bench-{run_id}-{i}@example.com", "bench-password")
+        response = await client.post(
+            "/users/register", json={"email": user.email, "username": f"bench-{run_id}-{i}", "password": user.password}
+        )
+        response.raise_for_status()
+        (await _login(client, user)).raise_for_status()
+        for start in range(0, notes, 500):
+            batch = [{"title": _text(3), "content": _text(60)} for _ in range(min(500, notes - start))]
+            response = await client.post("/notes/bulk", json=batch, headers=user.headers)
+            response.raise_for_status()
+            user.note_ids += [note["id"] for note in response.json()]
+        seeded.append(user)
+    return seeded
+
+async def _operation(client: httpx.AsyncClient, user: VirtualUser, name: str) -> httpx.Response | None:
+    if name == "login":
+        return await _login(client, user)
+    if name == "create":
+        response = await client.post("/notes/", json={"title": _text(3), "content": _text(60)}, headers=user.headers)
+        if response.status_code == 201:
+            user.note_ids.append(response.json()["id"])
+        return response
+    if name == "list":
+        return await client.get("/notes/", params={"limit": 50}, headers=user.headers)
+    if name == "search":
+        return await client.get("/notes/search", params={"q": random.choice(WORDS)}, headers=user.headers)
+    if not user.note_ids:
+        return None
+    note_id = random.choice(user.note_ids)
+    if name == "get":
+        return await client.get(f"/notes/{note_id}", headers=user.headers)
+    if name == "update":
+        return await client.put(f"/notes/{note_id}", json={"content": _text(60)}, headers=user.headers)
+    if name == "delete":
+        user.note_ids.remove(note_id)
+        return await client.delete(f"/notes/{note_id}", headers=user.headers)
+    raise ValueError(name)
+
+async def _worker(client: httpx.AsyncClient, users: list[VirtualUser], mix: dict[str, int], deadline: float, recorder: Recorder) -> None:
+    names, weights = list(mix), list(mix.values())
+    while time.perf_counter() < deadline:
+        user = random.choice(users)
+        name = random.choices(names, weights)[0]
+        start = time.perf_counter()
+        try:
+            response = await _operation(client, user, name)
+        except httpx.HTTPError:
+            recorder.record(name, time.perf_counter() - start, ok=False)
+            continue
+        if response is not None:
+            recorder.record(name, time.perf_counter() - start, ok=response.status_code < 400)
+
+async def run(args: argparse.Namespace) -> dict:
+    if args.base_url:
+        transport, base_url = None, args.base_url
+    else:
+        from main import app
+        transport, base_url = httpx.ASGITransport(app=app), "http://bench"
+
+    async with httpx.AsyncClient(transport=transport, base_url=base_url, timeout=args.timeout) as client:
+        users = await seed(client, args.users, args.notes)
+        recorder = Recorder()
+        start = time.perf_counter()
+        deadline = start + args.duration
+        await asyncio.gather(*(_worker(client, users, args.mix, deadline, recorder) for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+
+    endpoints = recorder.report(elapsed)
+    total = sum(endpoint["count"] for endpoint in endpoints.values())
+    return {
+        "meta": {
+            "target": args.base_url or "in-process",
+            "database": os.getenv("DATABASE_URL"),
+            "users": args.users,
+            "notes_per_user": args.notes,
+            "concurrency": args.concurrency,
+            "duration_s": round(elapsed, 3),
+            "python": platform.python_version(),
+        },
+        "total_rps": round(total / elapsed, 2),
+        "endpoints": endpoints,
+    }
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for name, current in result["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(name)
+        if previous is None:
+            continue
+        if previous["p95_ms"] and current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous['p95_ms']}ms -> {current['p95_ms']}ms")
+        if previous["rps"] and current["rps"] < previous["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: rps {previous['rps']} -> {current['rps']}")
+    return regressions
+
+def print_table(result: dict) -> None:
+    print(f"{'endpoint':<10}{'count':>8}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, endpoint in result["endpoints"].items():
+        print(
+            f"{name:<10}{endpoint['count']:>8}{endpoint['errors']:>8}{endpoint['rps']:>10}"
+            f"{endpoint['p50_ms']:>10}{endpoint['p95_ms']:>10}{endpoint['p99_ms']:>10}"
+        )
+    print(f"total {result['total_rps']} req/s over {result['meta']['duration_s']}s")
+
+def parse_mix(value: str) -> dict[str, int]:
+    mix = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"unknown operation '{name}'")
+        mix[name] = int(weight)
+    return mix
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", help="benchmark a running server instead of the in-process app")
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--notes", type=int, default=100, help="notes seeded per user")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of load after seeding")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX, help="e.g. list=5,get=5,create=1")
+    parser.add_argument("--seed", type=int, help="random seed for a repeatable operation sequence")
+    parser.add_argument("--output", help="write the JSON result here, e.g. to record a baseline")
+    parser.add_argument("--compare", help="baseline JSON to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    if not args.base_url:
+        os.environ.setdefault("DATABASE_URL", "sqlite:///./bench.db")
+        os.environ.setdefault("SECRET_KEY", "benchmark")
+        # Every simulated user shares one client address; measure the API, not the limiter.
+        os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+    result = asyncio.run(run(args))
+    print_table(result)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
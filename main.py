@@ -1,18 +1,48 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
-from app import models
+from app import database, jobs, models
 from app.database import engine
-from app.routers import users, notes
+from app.compression import CompressionMiddleware
+from app.instrumentation import InstrumentationMiddleware, instrument_engine
+from app.ratelimit import RateLimitHeadersMiddleware
+from app.routers import users, notes, metrics
 
 models.Base.metadata.create_all(bind=engine)
 
+instrument_engine(engine)
+if database.DATABASE_ASYNC:
+    instrument_engine(database.async_engine.sync_engine)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if not jobs.JOBS_IN_PROCESS:
+        yield
+        return
+    stop = asyncio.Event()
+    worker = asyncio.create_task(jobs.worker(stop))
+    try:
+        yield
+    finally:
+        stop.set()
+        await worker
+
 app = FastAPI(
     title="Notes API",
     description="REST API backend to manage user notes with JWT authentication.",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(RateLimitHeadersMiddleware)
+app.add_middleware(InstrumentationMiddleware)
+
 app.include_router(users.router)
 app.include_router(notes.router)
+if metrics.METRICS_ENABLED:
+    app.include_router(metrics.router)
 
 @app.get("/", tags=["Root"])
 def read_root():
@@ -1,10 +1,17 @@
 import pytest
 import os
 import sys
+from contextlib import contextmanager
 from typing import Generator
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+# Any lazy load of a relationship fails loudly instead of quietly becoming an N+1.
+os.environ.setdefault("RELATIONSHIP_LOADING", "raise_on_sql")
+# Tests run queued jobs explicitly with jobs.run_pending.
+os.environ.setdefault("JOBS_IN_PROCESS", "false")
+os.environ.setdefault("METRICS_ENABLED", "true")
+
 from fastapi.testclient import TestClient
 from sqlalchemy.orm import Session
 from sqlalchemy.orm.session import close_all_sessions
@@ -12,7 +19,10 @@ from sqlalchemy.orm.session import close_all_sessions
 from app.database import Base, engine, get_db, SessionLocal
 from main import app 
 from app.auth import create_access_token
-from app import models
+from app import auth, models, ratelimit, tokens
+from app.cache import note_cache
+from app.compression import compressed_cache
+from app.instrumentation import QueryCounter
 
 @pytest.fixture(scope="session", autouse=True)
 def create_test_tables():
@@ -21,6 +31,17 @@ def create_test_tables():
     Base.metadata.drop_all(bind=engine)
 
 
+@pytest.fixture(autouse=True)
+def clear_caches():
+    auth.user_cache.clear()
+    auth.known_user_ids.clear()
+    note_cache.clear()
+    ratelimit.store.clear()
+    compressed_cache.clear()
+    tokens.revoked_access_tokens.clear()
+    yield
+
+
 @pytest.fixture(scope="function")
 def db_session() -> Generator[Session, None, None]:
     connection = engine.connect()
@@ -49,11 +70,12 @@ def test_client(db_session: Session) -> Generator[TestClient, None, None]:
 def test_user(db_session: Session) -> models.User:
     user_data = {
         "email": "testuser@example.com",
+        "username": "testuser",
         "password": "password123"
     }
     from app.auth import get_password_hash
     hashed_password = get_password_hash(user_data["password"])
-    user = models.User(email=user_data["email"], hashed_password=hashed_password)
+    user = models.User(email=user_data["email"], username=user_data["username"], hashed_password=hashed_password)
     db_session.add(user)
     db_session.commit()
     db_session.refresh(user)
@@ -64,3 +86,19 @@ def test_user(db_session: Session) -> models.User:
 def auth_headers(test_user: models.User) -> dict:
     access_token = create_access_token(data={"sub": test_user.email})
     return {"Authorization": f"Bearer {access_token}"}
+
+
+@pytest.fixture
+def query_budget():
+    """Fail the test if the wrapped block runs more than ``max_queries`` statements.
+
+        with query_budget(2):
+            test_client.get("/notes/", headers=auth_headers)
+    """
+    @contextmanager
+    def budget(max_queries: int):
+        with QueryCounter() as counter:
+            yield counter
+        if counter.count > max_queries:
+            pytest.fail(f"query budget of {max_queries} exceeded\n{counter.report()}")
+    return budget
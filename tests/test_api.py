@@ -1,7 +1,23 @@
+import asyncio
+import gzip
+import json
+import re
+from datetime import timedelta
+
+import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy import exc, func, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import Session
-from app import models, schemas
+from app import auth, compression, jobs, models, ratelimit, revisions, schemas, sync, tokens
 from app.auth import create_access_token
+from app import database
+from app import serialization
+from app.cache import MemoryCacheBackend, note_cache
+from app.database import async_database_url, engine, run_db
+from app.instrumentation import QueryCounter
+from app.pagination import decode_cursor
+from app.passwords import password_context
 
 
 def test_read_root(test_client: TestClient):
@@ -13,7 +29,7 @@ class TestUsers:
     def test_register_user_success(self, test_client: TestClient, db_session: Session):
         response = test_client.post(
             "/users/register",
-            json={"email": "newuser@example.com", "password": "newpassword"},
+            json={"email": "newuser@example.com", "username": "newuser", "password": "newpassword"},
         )
         assert response.status_code == 201
         data = response.json()
@@ -26,7 +42,7 @@ class TestUsers:
     def test_register_user_duplicate_email(self, test_client: TestClient, test_user: models.User):
         response = test_client.post(
             "/users/register",
-            json={"email": test_user.email, "password": "anotherpassword"},
+            json={"email": test_user.email, "username": "anotheruser", "password": "anotherpassword"},
         )
         assert response.status_code == 400
         assert response.json() == {"detail": "Email already registered"}
@@ -49,6 +65,102 @@ class TestUsers:
         assert response.status_code == 401
         assert response.json() == {"detail": "Incorrect email or password"}
 
+    def test_login_with_username(self, test_client: TestClient, test_user: models.User):
+        response = test_client.post(
+            "/users/token",
+            data={"username": test_user.username, "password": "password123"},
+        )
+        assert response.status_code == 200
+
+    def test_login_sheds_load_when_hash_pool_is_full(self, test_client: TestClient, test_user: models.User, monkeypatch):
+        from app import auth
+        monkeypatch.setattr(auth, "PASSWORD_HASH_MAX_PENDING", 0)
+        response = test_client.post(
+            "/users/token",
+            data={"username": test_user.email, "password": "password123"},
+        )
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+
+    def test_login_is_rate_limited_per_client(self, test_client: TestClient, test_user: models.User, monkeypatch):
+        monkeypatch.setattr(ratelimit.login_limit, "limit", 2)
+        for _ in range(2):
+            response = test_client.post("/users/token", data={"username": "nobody@example.com", "password": "x"})
+            assert response.status_code == 401
+
+        response = test_client.post("/users/token", data={"username": test_user.email, "password": "password123"})
+
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) >= 1
+        assert response.headers["RateLimit-Remaining"] == "0"
+        assert response.headers["RateLimit-Policy"] == "2;w=60"
+
+    def test_login_is_rate_limited_per_account(self, test_client: TestClient, test_user: models.User, monkeypatch):
+        monkeypatch.setattr(ratelimit.login_account_limit, "limit", 1)
+        test_client.post("/users/token", data={"username": test_user.email, "password": "wrong"})
+
+        response = test_client.post("/users/token", data={"username": test_user.email.upper(), "password": "password123"})
+        other = test_client.post("/users/token", data={"username": "other@example.com", "password": "x"})
+
+        assert response.status_code == 429
+        assert other.status_code == 401
+
+    def test_login_rehashes_outdated_password_hash(self, test_client: TestClient, test_user: models.User, db_session: Session, monkeypatch):
+        monkeypatch.setattr(auth, "pwd_context", password_context(["bcrypt"], bcrypt_rounds=5))
+
+        response = test_client.post("/users/token", data={"username": test_user.email, "password": "password123"})
+        db_session.refresh(test_user)
+
+        assert response.status_code == 200
+        assert test_user.hashed_password.startswith("$2b$05$")
+        assert auth.verify_password("password123", test_user.hashed_password)
+
+    def test_refresh_token_rotates(self, test_client: TestClient, test_user: models.User, monkeypatch):
+        login = test_client.post("/users/token", data={"username": test_user.email, "password": "password123"}).json()
+        # Refreshing must never reach the password hasher.
+        monkeypatch.setattr(auth, "verify_and_update_password", None)
+
+        response = test_client.post("/users/token/refresh", json={"refresh_token": login["refresh_token"]})
+
+        assert response.status_code == 200
+        refreshed = response.json()
+        assert refreshed["refresh_token"] != login["refresh_token"]
+        me = test_client.get("/users/me", headers={"Authorization": f"Bearer {refreshed['access_token']}"})
+        assert me.json()["email"] == test_user.email
+
+    def test_reused_refresh_token_revokes_family(self, test_client: TestClient, test_user: models.User):
+        login = test_client.post("/users/token", data={"username": test_user.email, "password": "password123"}).json()
+        rotated = test_client.post("/users/token/refresh", json={"refresh_token": login["refresh_token"]}).json()
+
+        reuse = test_client.post("/users/token/refresh", json={"refresh_token": login["refresh_token"]})
+        successor = test_client.post("/users/token/refresh", json={"refresh_token": rotated["refresh_token"]})
+
+        assert reuse.status_code == 401
+        assert successor.status_code == 401
+
+    def test_revoked_access_token_is_rejected(self, test_client: TestClient, test_user: models.User, db_session: Session):
+        login = test_client.post("/users/token", data={"username": test_user.email, "password": "password123"}).json()
+        headers = {"Authorization": f"Bearer {login['access_token']}"}
+
+        response = test_client.post("/users/token/revoke", json={"refresh_token": login["refresh_token"]}, headers=headers)
+
+        assert response.status_code == 204
+        assert test_client.get("/notes/", headers=headers).status_code == 401
+        assert test_client.post("/users/token/refresh", json={"refresh_token": login["refresh_token"]}).status_code == 401
+        assert db_session.scalar(select(models.RevokedToken.jti)) is not None
+
+    def test_revocations_are_loaded_from_the_database(self, test_client: TestClient, test_user: models.User, db_session: Session):
+        login = test_client.post("/users/token", data={"username": test_user.email, "password": "password123"}).json()
+        headers = {"Authorization": f"Bearer {login['access_token']}"}
+        test_client.post("/users/token/revoke", headers=headers)
+        # Another worker has an empty in-memory list until it syncs.
+        tokens.revoked_access_tokens.clear()
+        assert test_client.get("/notes/", headers=headers).status_code == 200
+
+        tokens.revoked_access_tokens.sync(db_session)
+
+        assert test_client.get("/notes/", headers=headers).status_code == 401
+
     def test_login_wrong_email(self, test_client: TestClient):
         response = test_client.post(
             "/users/token",
@@ -64,8 +176,52 @@ class TestUsers:
         assert data["email"] == test_user.email
         assert data["id"] == test_user.id
 
+    def test_login_token_carries_user_id(self, test_client: TestClient, test_user: models.User):
+        response = test_client.post(
+            "/users/token",
+            data={"username": test_user.email, "password": "password123"},
+        )
+        token_data = auth.decode_access_token(response.json()["access_token"])
+        assert token_data.email == test_user.email
+        assert token_data.user_id == test_user.id
+
+    def test_current_user_is_cached(self, test_client: TestClient, auth_headers: dict):
+        test_client.get("/users/me", headers=auth_headers)
+        test_client.get("/users/me", headers=auth_headers)
+        assert auth.user_cache.stats()["hits"] == 1
+        assert auth.user_cache.stats()["misses"] == 1
+
+    def test_cached_user_invalidated_on_update(self, test_client: TestClient, test_user: models.User, auth_headers: dict, db_session: Session):
+        test_client.get("/users/me", headers=auth_headers)
+        test_user.username = "renamed"
+        db_session.commit()
+
+        response = test_client.get("/users/me", headers=auth_headers)
+        assert response.json()["username"] == "renamed"
+
+    def test_deleted_user_token_with_user_id_is_rejected(self, test_client: TestClient, test_user: models.User, db_session: Session):
+        headers = {"Authorization": f"Bearer {create_access_token(data={'sub': test_user.email, 'uid': test_user.id})}"}
+        assert test_client.get("/notes/", headers=headers).status_code == 200
+
+        db_session.delete(test_user)
+        db_session.commit()
+
+        assert test_client.post("/notes/", json={"title": "Orphan", "content": "Content"}, headers=headers).status_code == 401
+
 
 class TestNotes:
+    def test_rate_limit_headers_per_user(self, test_client: TestClient, auth_headers: dict, monkeypatch):
+        monkeypatch.setattr(ratelimit.api_limit, "limit", 2)
+        first = test_client.get("/notes/", headers=auth_headers)
+        second = test_client.get("/notes/", headers=auth_headers)
+        third = test_client.get("/notes/", headers=auth_headers)
+
+        assert first.headers["RateLimit-Limit"] == "2"
+        assert first.headers["RateLimit-Remaining"] == "1"
+        assert second.headers["RateLimit-Remaining"] == "0"
+        assert third.status_code == 429
+        assert "Retry-After" in third.headers
+
     def test_create_note(self, test_client: TestClient, auth_headers: dict, db_session: Session):
         note_data = {"title": "Test Note", "content": "This is a test note."}
         response = test_client.post("/notes/", json=note_data, headers=auth_headers)
@@ -93,6 +249,66 @@ class TestNotes:
         assert data[0]["title"] == "Note 1"
         assert data[1]["title"] == "Note 2"
 
+    def test_read_notes_with_cursor(self, test_client: TestClient, test_user: models.User, auth_headers: dict, db_session: Session):
+        for i in range(5):
+            db_session.add(models.Note(title=f"Note {i}", content="Content", owner_id=test_user.id))
+        db_session.commit()
+
+        first = test_client.get("/notes/?limit=2", headers=auth_headers)
+        assert [n["title"] for n in first.json()] == ["Note 0", "Note 1"]
+        cursor = first.headers["X-Next-Cursor"]
+
+        second = test_client.get(f"/notes/?limit=2&cursor={cursor}", headers=auth_headers)
+        assert [n["title"] for n in second.json()] == ["Note 2", "Note 3"]
+
+        last = test_client.get(f"/notes/?limit=2&cursor={second.headers['X-Next-Cursor']}", headers=auth_headers)
+        assert [n["title"] for n in last.json()] == ["Note 4"]
+        assert "X-Next-Cursor" not in last.headers
+
+    def test_read_notes_rejects_out_of_range_paging(self, test_client: TestClient, auth_headers: dict):
+        for query in ("limit=-1", "limit=0", "limit=1001", "skip=-1"):
+            assert test_client.get(f"/notes/?{query}", headers=auth_headers).status_code == 422
+
+    def test_read_notes_invalid_cursor(self, test_client: TestClient, auth_headers: dict):
+        response = test_client.get("/notes/?cursor=not-a-cursor", headers=auth_headers)
+        assert response.status_code == 400
+        assert response.json() == {"detail": "Invalid cursor"}
+
+    def test_search_notes(self, test_client: TestClient, test_user: models.User, auth_headers: dict, db_session: Session):
+        db_session.add(models.Note(title="Grocery list", content="Buy apples and milk", owner_id=test_user.id))
+        db_session.add(models.Note(title="Apples", content="Apple pie recipe with apples", owner_id=test_user.id))
+        db_session.add(models.Note(title="Meeting", content="Quarterly planning", owner_id=test_user.id))
+        db_session.commit()
+
+        response = test_client.get("/notes/search?q=apples", headers=auth_headers)
+        assert response.status_code == 200
+        hits = response.json()
+        assert [hit["title"] for hit in hits] == ["Apples", "Grocery list"]
+        assert hits[0]["title_highlight"] == "<mark>Apples</mark>"
+        assert "<mark>apples</mark>" in hits[1]["snippet"]
+
+    def test_search_notes_paginates_with_cursor(self, test_client: TestClient, test_user: models.User, auth_headers: dict, db_session: Session):
+        for i in range(3):
+            db_session.add(models.Note(title=f"Draft {i}", content="draft", owner_id=test_user.id))
+        db_session.commit()
+
+        first = test_client.get("/notes/search?q=draft&limit=2", headers=auth_headers)
+        second = test_client.get(f"/notes/search?q=draft&limit=2&cursor={first.headers['X-Next-Cursor']}", headers=auth_headers)
+        ids = [hit["id"] for hit in first.json() + second.json()]
+        assert len(ids) == 3
+        assert len(set(ids)) == 3
+
+    def test_search_ignores_other_users_notes(self, test_client: TestClient, auth_headers: dict, db_session: Session):
+        other_user = models.User(email="other@example.com", username="other", hashed_password="pw")
+        db_session.add(other_user)
+        db_session.commit()
+        db_session.add(models.Note(title="Secret", content="secret plans", owner_id=other_user.id))
+        db_session.commit()
+
+        response = test_client.get('/notes/search?q="secret', headers=auth_headers)
+        assert response.status_code == 200
+        assert response.json() == []
+
     def test_read_single_note(self, test_client: TestClient, test_user: models.User, auth_headers: dict, db_session: Session):
         note = models.Note(title="Specific Note", content="Content", owner_id=test_user.id)
         db_session.add(note)
@@ -126,6 +342,27 @@ class TestNotes:
         db_session.refresh(note)
         assert note.title == "Updated Title"
 
+    def test_update_note_sets_updated_at(self, test_client: TestClient, test_user: models.User, auth_headers: dict, db_session: Session):
+        note = models.Note(title="Original Title", content="Original Content", owner_id=test_user.id)
+        db_session.add(note)
+        db_session.commit()
+
+        response = test_client.put(f"/notes/{note.id}", json={"content": "Edited"}, headers=auth_headers)
+
+        data = response.json()
+        assert data["title"] == "Original Title"
+        assert data["content"] == "Edited"
+        assert data["updated_at"] is not None
+
+    def test_update_note_not_found(self, test_client: TestClient, auth_headers: dict):
+        response = test_client.put("/notes/9999", json={"title": "Nope"}, headers=auth_headers)
+        assert response.status_code == 404
+        assert response.json() == {"detail": "Note not found"}
+
+    def test_delete_note_not_found(self, test_client: TestClient, auth_headers: dict):
+        response = test_client.delete("/notes/9999", headers=auth_headers)
+        assert response.status_code == 404
+
     def test_delete_note(self, test_client: TestClient, test_user: models.User, auth_headers: dict, db_session: Session):
         note = models.Note(title="To Be Deleted", content="Content", owner_id=test_user.id)
         db_session.add(note)
@@ -138,8 +375,326 @@ class TestNotes:
         deleted_note = db_session.query(models.Note).filter(models.Note.id == note_id).first()
         assert deleted_note is None
         
+    def test_create_notes_bulk(self, test_client: TestClient, test_user: models.User, auth_headers: dict, db_session: Session):
+        payload = [{"title": f"Bulk {i}", "content": "Content"} for i in range(3)]
+        response = test_client.post("/notes/bulk", json=payload, headers=auth_headers)
+
+        assert response.status_code == 201
+        assert [note["title"] for note in response.json()] == ["Bulk 0", "Bulk 1", "Bulk 2"]
+        assert all(note["owner_id"] == test_user.id for note in response.json())
+        assert db_session.query(models.Note).filter(models.Note.owner_id == test_user.id).count() == 3
+
+    def test_update_notes_bulk(self, test_client: TestClient, test_user: models.User, auth_headers: dict, db_session: Session):
+        first = models.Note(title="First", content="Content", owner_id=test_user.id)
+        second = models.Note(title="Second", content="Content", owner_id=test_user.id)
+        db_session.add_all([first, second])
+        db_session.commit()
+
+        payload = [{"id": first.id, "title": "First edited"}, {"id": second.id, "content": "New"}, {"id": 9999, "title": "Missing"}]
+        response = test_client.patch("/notes/bulk", json=payload, headers=auth_headers)
+
+        assert response.status_code == 200
+        assert response.json() == [
+            {"id": first.id, "status": "updated"},
+            {"id": second.id, "status": "updated"},
+            {"id": 9999, "status": "not_found"},
+        ]
+        db_session.expire_all()
+        assert first.title == "First edited"
+        assert first.content == "Content"
+        assert second.content == "New"
+
+    def test_delete_notes_bulk(self, test_client: TestClient, test_user: models.User, auth_headers: dict, db_session: Session):
+        other_user = models.User(email="other@example.com", username="other", hashed_password="pw")
+        db_session.add(other_user)
+        db_session.commit()
+        mine = models.Note(title="Mine", content="Content", owner_id=test_user.id)
+        theirs = models.Note(title="Theirs", content="Content", owner_id=other_user.id)
+        db_session.add_all([mine, theirs])
+        db_session.commit()
+        mine_id, theirs_id = mine.id, theirs.id
+
+        response = test_client.request("DELETE", "/notes/bulk", json={"ids": [mine_id, theirs_id]}, headers=auth_headers)
+
+        assert response.status_code == 200
+        assert response.json() == [{"id": mine_id, "status": "deleted"}, {"id": theirs_id, "status": "not_found"}]
+        assert db_session.query(models.Note).filter(models.Note.id == theirs_id).count() == 1
+
+    def test_read_note_not_modified(self, test_client: TestClient, test_user: models.User, auth_headers: dict, db_session: Session):
+        note = models.Note(title="Cached", content="Content", owner_id=test_user.id)
+        db_session.add(note)
+        db_session.commit()
+
+        first = test_client.get(f"/notes/{note.id}", headers=auth_headers)
+        etag = first.headers["ETag"]
+        second = test_client.get(f"/notes/{note.id}", headers={**auth_headers, "If-None-Match": etag})
+
+        assert second.status_code == 304
+        assert second.content == b""
+        assert second.headers["ETag"] == etag
+
+    def test_read_notes_not_modified_until_changed(self, test_client: TestClient, test_user: models.User, auth_headers: dict, db_session: Session):
+        note = models.Note(title="Listed", content="Content", owner_id=test_user.id)
+        db_session.add(note)
+        db_session.commit()
+
+        etag = test_client.get("/notes/", headers=auth_headers).headers["ETag"]
+        assert test_client.get("/notes/", headers={**auth_headers, "If-None-Match": etag}).status_code == 304
+
+        test_client.put(f"/notes/{note.id}", json={"title": "Changed"}, headers=auth_headers)
+        response = test_client.get("/notes/", headers={**auth_headers, "If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+
+    def test_update_note_with_stale_etag_fails(self, test_client: TestClient, test_user: models.User, auth_headers: dict, db_session: Session):
+        note = models.Note(title="Shared", content="Content", owner_id=test_user.id)
+        db_session.add(note)
+        db_session.commit()
+
+        etag = test_client.get(f"/notes/{note.id}", headers=auth_headers).headers["ETag"]
+        updated = test_client.put(f"/notes/{note.id}", json={"title": "Mine"}, headers={**auth_headers, "If-Match": etag})
+        assert updated.status_code == 200
+        assert updated.headers["ETag"] != etag
+
+        stale = test_client.put(f"/notes/{note.id}", json={"title": "Theirs"}, headers={**auth_headers, "If-Match": etag})
+        assert stale.status_code == 412
+
+        deleted = test_client.delete(f"/notes/{note.id}", headers={**auth_headers, "If-Match": etag})
+        assert deleted.status_code == 412
+
+        deleted = test_client.delete(f"/notes/{note.id}", headers={**auth_headers, "If-Match": updated.headers["ETag"]})
+        assert deleted.status_code == 204
+
+    def test_note_changes_since_token(self, test_client: TestClient, test_user: models.User, auth_headers: dict, db_session: Session, monkeypatch):
+        monkeypatch.setattr(sync, "SYNC_OVERLAP_SECONDS", 0)
+        kept = models.Note(title="Kept", content="Content", owner_id=test_user.id)
+        removed = models.Note(title="Removed", content="Content", owner_id=test_user.id)
+        db_session.add_all([kept, removed])
+        db_session.commit()
+        kept_id, removed_id = kept.id, removed.id
+
+        full = test_client.get("/notes/changes", headers=auth_headers).json()
+        assert {note["id"] for note in full["changed"]} == {kept_id, removed_id}
+        assert full["deleted"] == []
+
+        empty = test_client.get(f"/notes/changes?since={full['sync_token']}", headers=auth_headers).json()
+        assert empty["changed"] == []
+        assert empty["deleted"] == []
+
+        test_client.put(f"/notes/{kept_id}", json={"title": "Kept and edited"}, headers=auth_headers)
+        test_client.delete(f"/notes/{removed_id}", headers=auth_headers)
+        created = test_client.post("/notes/", json={"title": "New", "content": "Content"}, headers=auth_headers).json()
+
+        delta = test_client.get(f"/notes/changes?since={empty['sync_token']}", headers=auth_headers).json()
+        assert [note["id"] for note in delta["changed"]] == [kept_id, created["id"]]
+        assert delta["deleted"] == [removed_id]
+        assert delta["has_more"] is False
+
+    def test_note_changes_paginates_ties(self, test_client: TestClient, auth_headers: dict):
+        created = test_client.post(
+            "/notes/bulk", json=[{"title": f"Bulk {i}", "content": "Content"} for i in range(5)], headers=auth_headers
+        ).json()
+
+        seen, token, has_more = [], None, True
+        while has_more:
+            url = "/notes/changes?limit=2" + (f"&since={token}" if token else "")
+            page = test_client.get(url, headers=auth_headers).json()
+            seen += [note["id"] for note in page["changed"]]
+            token, has_more = page["sync_token"], page["has_more"]
+
+        assert seen == [note["id"] for note in created]
+
+    def test_note_changes_catch_late_commits(self, test_client: TestClient, test_user: models.User, auth_headers: dict, db_session: Session):
+        test_client.post("/notes/", json={"title": "Synced", "content": "Content"}, headers=auth_headers)
+        token = test_client.get("/notes/changes", headers=auth_headers).json()["sync_token"]
+        position = sync.SyncPosition.from_dict(decode_cursor(token))
+
+        # Committed after the sync, but stamped with the start of its transaction.
+        late = models.Note(title="Late", content="Content", owner_id=test_user.id, changed_at=position.changed_at - timedelta(seconds=1))
+        db_session.add(late)
+        db_session.commit()
+        db_session.add(models.NoteTombstone(note_id=late.id + 1000, owner_id=test_user.id, deleted_at=position.deleted_at - timedelta(seconds=1)))
+        db_session.commit()
+
+        delta = test_client.get(f"/notes/changes?since={token}", headers=auth_headers).json()
+        assert late.id in [note["id"] for note in delta["changed"]]
+        assert delta["deleted"] == [late.id + 1000]
+
+    def test_note_changes_paginates_deletions(self, test_client: TestClient, auth_headers: dict, monkeypatch):
+        monkeypatch.setattr(sync, "SYNC_OVERLAP_SECONDS", 0)
+        created = test_client.post(
+            "/notes/bulk", json=[{"title": f"Bulk {i}", "content": "Content"} for i in range(5)], headers=auth_headers
+        ).json()
+        token = test_client.get("/notes/changes", headers=auth_headers).json()["sync_token"]
+        test_client.request("DELETE", "/notes/bulk", json={"ids": [note["id"] for note in created]}, headers=auth_headers)
+
+        deleted, has_more = [], True
+        while has_more:
+            page = test_client.get(f"/notes/changes?limit=2&since={token}", headers=auth_headers).json()
+            assert len(page["deleted"]) <= 2
+            deleted += page["deleted"]
+            token, has_more = page["sync_token"], page["has_more"]
+
+        assert sorted(deleted) == sorted(note["id"] for note in created)
+
+    def test_note_changes_invalid_token(self, test_client: TestClient, auth_headers: dict):
+        response = test_client.get("/notes/changes?since=e30", headers=auth_headers)
+        assert response.status_code == 400
+        assert response.json() == {"detail": "Invalid sync token"}
+
+    def test_note_reads_are_cached_until_written(self, test_client: TestClient, test_user: models.User, auth_headers: dict, db_session: Session):
+        note = models.Note(title="Popular", content="Content", owner_id=test_user.id)
+        db_session.add(note)
+        db_session.commit()
+
+        first = test_client.get(f"/notes/{note.id}", headers=auth_headers)
+        second = test_client.get(f"/notes/{note.id}", headers=auth_headers)
+        assert second.json() == first.json()
+        assert second.headers["ETag"] == first.headers["ETag"]
+        assert note_cache.stats() == {"hits": 1, "misses": 1, "hit_ratio": 0.5}
+
+        test_client.put(f"/notes/{note.id}", json={"title": "Edited"}, headers=auth_headers)
+        assert test_client.get(f"/notes/{note.id}", headers=auth_headers).json()["title"] == "Edited"
+
+    def test_memory_cache_counters_are_bounded(self):
+        backend = MemoryCacheBackend(maxsize=2)
+        evicted = backend.incr("notes-gen:1")
+        backend.incr("notes-gen:2")
+        backend.incr("notes-gen:3")
+
+        assert backend._counters.stats()["size"] == 2
+        # An evicted generation starts fresh rather than repeating an old value.
+        assert backend.counter("notes-gen:1") not in (0, evicted)
+
+    def test_note_list_cache_invalidated_by_create(self, test_client: TestClient, auth_headers: dict):
+        test_client.post("/notes/", json={"title": "One", "content": "Content"}, headers=auth_headers)
+        assert len(test_client.get("/notes/", headers=auth_headers).json()) == 1
+
+        test_client.post("/notes/", json={"title": "Two", "content": "Content"}, headers=auth_headers)
+        assert len(test_client.get("/notes/", headers=auth_headers).json()) == 2
+
+    def test_fast_serialization_matches_schema(self, test_user: models.User, db_session: Session, monkeypatch):
+        db_session.add(models.Note(title="Fast", content="Path", owner_id=test_user.id))
+        db_session.commit()
+        rows = db_session.execute(select(*serialization.NOTE_COLUMNS)).all()
+
+        fast = json.loads(serialization.encode_notes(rows))
+        monkeypatch.setattr(serialization, "FAST_JSON_RESPONSES", False)
+        validated = json.loads(serialization.encode_notes(rows))
+
+        assert fast == validated
+        assert set(fast[0]) == set(schemas.NoteInDB.model_fields)
+
+    def test_read_notes_summary_view(self, test_client: TestClient, test_user: models.User, auth_headers: dict, db_session: Session):
+        db_session.add(models.Note(title="Long", content="x" * (serialization.NOTE_PREVIEW_LENGTH + 50), owner_id=test_user.id))
+        db_session.commit()
+
+        response = test_client.get("/notes/?view=summary", headers=auth_headers)
+
+        assert response.status_code == 200
+        summary = response.json()[0]
+        assert set(summary) == {"id", "title", "preview", "created_at", "updated_at"}
+        assert summary["preview"] == "x" * serialization.NOTE_PREVIEW_LENGTH
+
+    def test_read_notes_selected_fields(self, test_client: TestClient, test_user: models.User, auth_headers: dict, db_session: Session):
+        db_session.add(models.Note(title="Projected", content="Content", owner_id=test_user.id))
+        db_session.commit()
+
+        response = test_client.get("/notes/?fields=title", headers=auth_headers)
+        assert response.status_code == 200
+        assert list(response.json()[0]) == ["id", "title"]
+        assert response.json()[0]["title"] == "Projected"
+
+        response = test_client.get("/notes/?fields=title,secret", headers=auth_headers)
+        assert response.status_code == 400
+        assert response.json() == {"detail": "Unknown fields: secret"}
+
+    def test_export_notes_ndjson(self, test_client: TestClient, test_user: models.User, auth_headers: dict, db_session: Session, monkeypatch):
+        from app import ndjson
+        monkeypatch.setattr(ndjson, "EXPORT_BATCH_SIZE", 2)
+        for i in range(5):
+            db_session.add(models.Note(title=f"Export {i}", content="Content", owner_id=test_user.id))
+        db_session.commit()
+
+        response = test_client.get("/notes/export", headers=auth_headers)
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert [line["title"] for line in lines] == [f"Export {i}" for i in range(5)]
+
+    def test_export_notes_gzip(self, test_client: TestClient, test_user: models.User, auth_headers: dict, db_session: Session):
+        db_session.add(models.Note(title="Zipped", content="Content", owner_id=test_user.id))
+        db_session.commit()
+
+        response = test_client.get("/notes/export?gzip=true", headers=auth_headers)
+
+        assert response.headers["content-type"] == "application/gzip"
+        lines = gzip.decompress(response.content).decode().splitlines()
+        assert json.loads(lines[0])["title"] == "Zipped"
+
+    def test_import_notes_ndjson(self, test_client: TestClient, test_user: models.User, auth_headers: dict, db_session: Session, monkeypatch):
+        from app import ndjson
+        monkeypatch.setattr(ndjson, "IMPORT_BATCH_SIZE", 2)
+        body = "\n".join([
+            json.dumps({"title": "One", "content": "Content"}),
+            json.dumps({"title": "Two", "content": "Content"}),
+            "",
+            json.dumps({"title": "", "content": "Content"}),
+            "not json",
+            json.dumps({"title": "Three", "content": "Content"}),
+        ])
+
+        response = test_client.post("/notes/import", content=body.encode(), headers=auth_headers)
+
+        assert response.status_code == 200
+        summary = response.json()
+        assert summary["accepted"] == 3
+        assert summary["rejected"] == 2
+        assert [error["line"] for error in summary["errors"]] == [4, 5]
+        titles = [note.title for note in db_session.query(models.Note).filter(models.Note.owner_id == test_user.id).order_by(models.Note.id)]
+        assert titles == ["One", "Two", "Three"]
+
+    def test_import_notes_gzip(self, test_client: TestClient, test_user: models.User, auth_headers: dict, db_session: Session):
+        body = gzip.compress(b"".join(json.dumps({"title": f"Zip {i}", "content": "c"}).encode() + b"\n" for i in range(3)))
+
+        response = test_client.post("/notes/import?gzip=true", content=body, headers=auth_headers)
+
+        assert response.json() == {"accepted": 3, "rejected": 0, "errors": [], "aborted": None}
+        assert db_session.query(models.Note).filter(models.Note.owner_id == test_user.id).count() == 3
+
+    def test_import_limits_decompressed_size(self, test_client: TestClient, auth_headers: dict, monkeypatch):
+        from app import ndjson
+        monkeypatch.setattr(ndjson, "IMPORT_MAX_BODY_BYTES", 1024 * 1024)
+        body = gzip.compress(b"\n" * (16 * 1024 * 1024))
+        assert len(body) < 64 * 1024
+
+        response = test_client.post("/notes/import?gzip=true", content=body, headers=auth_headers)
+
+        assert response.status_code == 413
+        assert response.json()["aborted"] == {"line": 1024 * 1024 + 1, "error": "Body exceeds 1048576 bytes"}
+
+    def test_import_stopped_by_long_line_keeps_earlier_lines(self, test_client: TestClient, test_user: models.User, auth_headers: dict, db_session: Session, monkeypatch):
+        from app import ndjson
+        monkeypatch.setattr(ndjson, "IMPORT_BATCH_SIZE", 2)
+        monkeypatch.setattr(ndjson, "IMPORT_MAX_LINE_BYTES", 100)
+        lines = [json.dumps({"title": f"T{i}", "content": "Content"}) for i in range(3)]
+        body = "\n".join(lines + [json.dumps({"title": "Huge", "content": "x" * 200})]).encode()
+
+        response = test_client.post("/notes/import", content=body, headers=auth_headers)
+
+        assert response.status_code == 413
+        assert response.json() == {
+            "accepted": 3,
+            "rejected": 0,
+            "errors": [],
+            "aborted": {"line": 4, "error": "Line 4 exceeds 100 bytes"},
+        }
+        titles = [note.title for note in db_session.query(models.Note).filter(models.Note.owner_id == test_user.id).order_by(models.Note.id)]
+        assert titles == ["T0", "T1", "T2"]
+
     def test_user_cannot_access_another_users_note(self, test_client: TestClient, test_user: models.User, db_session: Session):
-        other_user = models.User(email="other@example.com", hashed_password="pw")
+        other_user = models.User(email="other@example.com", username="other", hashed_password="pw")
         db_session.add(other_user)
         db_session.commit()
         
@@ -151,4 +706,400 @@ class TestNotes:
         auth_headers = {"Authorization": f"Bearer {access_token}"}
 
         response = test_client.get(f"/notes/{other_note.id}", headers=auth_headers)
-        assert response.status_code == 404
\ No newline at end of file
+        assert response.status_code == 404
+
+class TestDatabase:
+    def test_async_database_url(self):
+        assert async_database_url("postgresql://user:pw@db/notes") == "postgresql+asyncpg://user:pw@db/notes"
+        assert async_database_url("sqlite:///./notes.db") == "sqlite+aiosqlite:///./notes.db"
+
+    def test_run_db_with_async_session(self):
+        async def count_users() -> int:
+            async_engine = create_async_engine(async_database_url(engine.url.render_as_string(hide_password=False)))
+            async with AsyncSession(async_engine) as session:
+                count = await run_db(session, lambda db: db.query(models.User).count())
+            await async_engine.dispose()
+            return count
+
+        assert asyncio.run(count_users()) == 0
+
+    def test_engine_options_null_pool_for_external_pooler(self, monkeypatch):
+        monkeypatch.setattr(database, "DB_USE_NULL_POOL", True)
+        options = database.engine_options("postgresql://user:pw@pgbouncer/notes")
+        assert options["poolclass"] is database.NullPool
+        assert "pool_size" not in options
+
+    def test_pool_metrics(self, test_client: TestClient):
+        response = test_client.get("/metrics/pool")
+        assert response.status_code == 200
+        pool = response.json()["sync"]
+        assert pool["pool_class"] == "TimedQueuePool"
+        assert pool["size"] == database.DB_POOL_SIZE
+        assert pool["checkouts"] >= 1
+
+
+class TestInstrumentation:
+    def test_server_timing_header(self, test_client: TestClient, test_user: models.User, auth_headers: dict, db_session: Session):
+        db_session.add(models.Note(title="Timed", content="Content", owner_id=test_user.id))
+        db_session.commit()
+
+        response = test_client.get("/notes/", headers=auth_headers)
+
+        server_timing = response.headers["Server-Timing"]
+        assert server_timing.startswith("total;dur=")
+        assert re.search(r'db;dur=[0-9.]+;desc="[1-9][0-9]* queries"', server_timing)
+        assert "auth;dur=" in server_timing
+
+    def test_prometheus_metrics(self, test_client: TestClient, auth_headers: dict):
+        test_client.get("/notes/", headers=auth_headers)
+
+        response = test_client.get("/metrics")
+
+        assert response.status_code == 200
+        assert 'http_request_duration_seconds_count{method="GET",route="/notes/",status="200"}' in response.text
+        assert 'http_request_sql_queries_bucket{method="GET",route="/notes/",le="1"}' in response.text
+        assert 'db_pool_checkouts_total{engine="sync"}' in response.text
+
+    def test_metrics_require_configured_token(self, test_client: TestClient, monkeypatch):
+        from app.routers import metrics
+        monkeypatch.setattr(metrics, "METRICS_TOKEN", "scraper-secret")
+
+        assert test_client.get("/metrics/cache").status_code == 401
+        assert test_client.get("/metrics/cache", headers={"Authorization": "Bearer wrong"}).status_code == 401
+        assert test_client.get("/metrics/cache", headers={"Authorization": "Bearer scraper-secret"}).status_code == 200
+
+
+class TestRevisions:
+    def test_diff_round_trip(self):
+        old = "line one\nline two\nline three\n"
+        new = "line one\nline 2\nline three\nline four"
+        assert revisions.apply_diff(new, revisions.diff(new, old)) == old
+        assert revisions.apply_diff(old, revisions.diff(old, new)) == new
+
+    def test_reconstruct_every_version(self, test_client: TestClient, test_user: models.User, auth_headers: dict, db_session: Session, monkeypatch):
+        monkeypatch.setattr(revisions, "NOTE_REVISION_SNAPSHOT_INTERVAL", 3)
+        versions = [("Draft", "first line\n")]
+        note_id = test_client.post("/notes/", json={"title": "Draft", "content": "first line\n"}, headers=auth_headers).json()["id"]
+        for i in range(7):
+            title = f"Draft {i // 2}"
+            content = versions[-1][1] + f"line {i}\n"
+            test_client.put(f"/notes/{note_id}", json={"title": title, "content": content}, headers=auth_headers)
+            versions.append((title, content))
+
+        listed = test_client.get(f"/notes/{note_id}/revisions", headers=auth_headers).json()
+        assert [revision["version"] for revision in listed] == [7, 6, 5, 4, 3, 2, 1]
+        assert [revision["version"] for revision in listed if revision["snapshot"]] == [6, 3]
+        for version, (title, content) in enumerate(versions, start=1):
+            response = test_client.get(f"/notes/{note_id}/revisions/{version}", headers=auth_headers)
+            assert response.status_code == 200
+            assert (response.json()["title"], response.json()["content"]) == (title, content)
+        assert test_client.get(f"/notes/{note_id}/revisions/9", headers=auth_headers).status_code == 404
+
+    def test_bulk_update_records_revisions(self, test_client: TestClient, test_user: models.User, auth_headers: dict, db_session: Session):
+        notes = [models.Note(title=f"Note {i}", content=f"Content {i}", owner_id=test_user.id) for i in range(2)]
+        db_session.add_all(notes)
+        db_session.commit()
+        ids = [note.id for note in notes]
+
+        test_client.patch("/notes/bulk", json=[{"id": note_id, "content": "Changed"} for note_id in ids], headers=auth_headers)
+
+        for i, note_id in enumerate(ids):
+            previous = test_client.get(f"/notes/{note_id}/revisions/1", headers=auth_headers).json()
+            assert previous["content"] == f"Content {i}"
+
+    def test_revisions_are_private_and_deleted_with_the_note(self, test_client: TestClient, test_user: models.User, auth_headers: dict, db_session: Session):
+        note_id = test_client.post("/notes/", json={"title": "Private", "content": "v1"}, headers=auth_headers).json()["id"]
+        test_client.put(f"/notes/{note_id}", json={"content": "v2"}, headers=auth_headers)
+        other = models.User(email="other@example.com", username="other", hashed_password="x")
+        db_session.add(other)
+        db_session.commit()
+        other_headers = {"Authorization": f"Bearer {create_access_token(data={'sub': other.email})}"}
+
+        assert test_client.get(f"/notes/{note_id}/revisions", headers=other_headers).status_code == 404
+        assert test_client.get(f"/notes/{note_id}/revisions/1", headers=other_headers).status_code == 404
+
+        test_client.delete(f"/notes/{note_id}", headers=auth_headers)
+        assert db_session.scalar(select(func.count()).select_from(models.NoteRevision)) == 0
+
+    def test_update_note_deleted_after_lock_is_not_found(self, test_client: TestClient, auth_headers: dict, monkeypatch):
+        from app.routers import notes
+        note_id = test_client.post("/notes/", json={"title": "Racy", "content": "v1"}, headers=auth_headers).json()["id"]
+        lock = notes._lock_owned_note
+
+        def lock_then_delete(db, note_id, owner_id, *columns):
+            # SQLite ignores FOR UPDATE, so a concurrent delete can land here.
+            current = lock(db, note_id, owner_id, *columns)
+            db.query(models.Note).filter(models.Note.id == note_id).delete()
+            return current
+
+        monkeypatch.setattr(notes, "_lock_owned_note", lock_then_delete)
+        response = test_client.put(f"/notes/{note_id}", json={"content": "v2"}, headers=auth_headers)
+
+        assert response.status_code == 404
+
+class TestPatch:
+    def _create(self, test_client: TestClient, auth_headers: dict, content: str = "Hello world\nSecond line\n"):
+        response = test_client.post("/notes/", json={"title": "Patch me", "content": content}, headers=auth_headers)
+        return response.json()["id"], response.headers["ETag"]
+
+    def test_patch_note_splices_content(self, test_client: TestClient, auth_headers: dict):
+        note_id, etag = self._create(test_client, auth_headers)
+
+        response = test_client.patch(
+            f"/notes/{note_id}",
+            json={"splices": [{"start": 6, "end": 11, "text": "there"}, {"start": 24, "end": 24, "text": "Third line\n"}]},
+            headers={**auth_headers, "If-Match": etag},
+        )
+
+        assert response.status_code == 200
+        assert response.json()["content"] == "Hello there\nSecond line\nThird line\n"
+        assert response.headers["ETag"] != etag
+        previous = test_client.get(f"/notes/{note_id}/revisions/1", headers=auth_headers).json()
+        assert previous["content"] == "Hello world\nSecond line\n"
+
+    def test_patch_note_requires_if_match(self, test_client: TestClient, auth_headers: dict):
+        note_id, _ = self._create(test_client, auth_headers)
+
+        response = test_client.patch(f"/notes/{note_id}", json={"title": "New"}, headers=auth_headers)
+
+        assert response.status_code == 428
+
+    def test_patch_note_rejects_wildcard_if_match(self, test_client: TestClient, auth_headers: dict):
+        note_id, _ = self._create(test_client, auth_headers)
+        test_client.put(f"/notes/{note_id}", json={"content": "Changed elsewhere"}, headers=auth_headers)
+
+        response = test_client.patch(
+            f"/notes/{note_id}", json={"splices": [{"start": 0, "end": 5, "text": "Hi"}]}, headers={**auth_headers, "If-Match": "*"}
+        )
+
+        assert response.status_code == 428
+        assert test_client.get(f"/notes/{note_id}", headers=auth_headers).json()["content"] == "Changed elsewhere"
+
+    def test_patch_note_rejects_stale_base(self, test_client: TestClient, auth_headers: dict):
+        note_id, etag = self._create(test_client, auth_headers)
+        test_client.put(f"/notes/{note_id}", json={"content": "Changed elsewhere"}, headers=auth_headers)
+
+        response = test_client.patch(
+            f"/notes/{note_id}", json={"splices": [{"start": 0, "end": 5, "text": "Hi"}]}, headers={**auth_headers, "If-Match": etag}
+        )
+
+        assert response.status_code == 412
+        assert test_client.get(f"/notes/{note_id}", headers=auth_headers).json()["content"] == "Changed elsewhere"
+
+    def test_patch_note_rejects_overlapping_splices(self, test_client: TestClient, auth_headers: dict):
+        note_id, etag = self._create(test_client, auth_headers)
+
+        response = test_client.patch(
+            f"/notes/{note_id}",
+            json={"splices": [{"start": 0, "end": 5, "text": "A"}, {"start": 3, "end": 8, "text": "B"}]},
+            headers={**auth_headers, "If-Match": etag},
+        )
+
+        assert response.status_code == 422
+
+    def test_patch_note_deleted_after_lock_is_not_found(self, test_client: TestClient, auth_headers: dict, monkeypatch):
+        from app.routers import notes
+        note_id, etag = self._create(test_client, auth_headers)
+        lock = notes._lock_owned_note
+
+        def lock_then_delete(db, note_id, owner_id, *columns):
+            current = lock(db, note_id, owner_id, *columns)
+            db.query(models.Note).filter(models.Note.id == note_id).delete()
+            return current
+
+        monkeypatch.setattr(notes, "_lock_owned_note", lock_then_delete)
+        response = test_client.patch(
+            f"/notes/{note_id}", json={"splices": [{"start": 0, "end": 5, "text": "Hi"}]}, headers={**auth_headers, "If-Match": etag}
+        )
+
+        assert response.status_code == 404
+
+class TestJobs:
+    def test_note_changes_queue_word_count(self, test_client: TestClient, auth_headers: dict, db_session: Session, monkeypatch):
+        monkeypatch.setattr(sync, "SYNC_OVERLAP_SECONDS", 0)
+        created = test_client.post("/notes/", json={"title": "Count", "content": "one two three"}, headers=auth_headers)
+        note, etag = created.json(), created.headers["ETag"]
+        assert note["word_count"] is None
+        assert db_session.scalar(select(models.NoteJob.kind)) == "word_count"
+        token = test_client.get("/notes/changes", headers=auth_headers).json()["sync_token"]
+
+        assert jobs.run_pending(db_session) == 1
+
+        counted = test_client.get(f"/notes/{note['id']}", headers={**auth_headers, "If-None-Match": etag})
+        assert counted.status_code == 200
+        assert counted.json()["word_count"] == 3
+        assert counted.json()["updated_at"] == note["updated_at"]
+        assert counted.headers["ETag"] != etag
+        assert db_session.scalar(select(func.count()).select_from(models.NoteJob)) == 0
+        delta = test_client.get(f"/notes/changes?since={token}", headers=auth_headers).json()
+        assert [changed["word_count"] for changed in delta["changed"]] == [3]
+
+        test_client.put(f"/notes/{note['id']}", json={"content": "one two three four"}, headers=auth_headers)
+        jobs.run_pending(db_session)
+        assert test_client.get("/notes/", headers=auth_headers).json()[0]["word_count"] == 4
+
+    def test_job_between_patches_keeps_the_etag_usable(self, test_client: TestClient, auth_headers: dict, db_session: Session):
+        note_id = test_client.post("/notes/", json={"title": "Typing", "content": "one"}, headers=auth_headers).json()["id"]
+        etag = test_client.get(f"/notes/{note_id}", headers=auth_headers).headers["ETag"]
+
+        first = test_client.patch(
+            f"/notes/{note_id}", json={"splices": [{"start": 3, "end": 3, "text": " two"}]}, headers={**auth_headers, "If-Match": etag}
+        )
+        assert first.status_code == 200
+        jobs.run_pending(db_session)
+
+        second = test_client.patch(
+            f"/notes/{note_id}", json={"splices": [{"start": 7, "end": 7, "text": " three"}]}, headers={**auth_headers, "If-Match": first.headers["ETag"]}
+        )
+        assert second.status_code == 200
+        assert second.json()["content"] == "one two three"
+        # The job is not an edit, so the revision keeps the time of the first PATCH.
+        assert test_client.get(f"/notes/{note_id}/revisions", headers=auth_headers).json()[0]["saved_at"] == first.json()["updated_at"]
+
+    def test_worker_runs_on_successive_event_loops(self, monkeypatch):
+        batches = []
+        monkeypatch.setattr(jobs, "_run_batch", lambda: batches.append(1) or 0)
+        monkeypatch.setattr(jobs, "JOBS_POLL_SECONDS", 60)
+
+        async def lifespan():
+            stop = asyncio.Event()
+            task = asyncio.ensure_future(jobs.worker(stop))
+            await asyncio.sleep(0.05)
+            jobs.notify()
+            await asyncio.sleep(0.05)
+            stop.set()
+            await task
+
+        # A second app lifespan runs on a new loop; the worker must still sleep between batches.
+        for _ in range(2):
+            batches.clear()
+            asyncio.run(lifespan())
+            assert len(batches) == 2
+
+    def test_imported_notes_get_word_counts(self, test_client: TestClient, auth_headers: dict, db_session: Session):
+        body = b'{"title": "A", "content": "alpha beta"}\n{"title": "B", "content": "gamma"}\n'
+        test_client.post("/notes/import", content=body, headers={**auth_headers, "Content-Type": "application/x-ndjson"})
+
+        jobs.run_pending(db_session)
+
+        assert [note["word_count"] for note in test_client.get("/notes/", headers=auth_headers).json()] == [2, 1]
+
+    def test_failed_job_is_retried_with_backoff(self, test_client: TestClient, auth_headers: dict, db_session: Session, monkeypatch):
+        def fail(db, job):
+            raise RuntimeError("boom")
+        monkeypatch.setitem(jobs.HANDLERS, "word_count", fail)
+        monkeypatch.setattr(jobs, "JOBS_MAX_ATTEMPTS", 2)
+        test_client.post("/notes/", json={"title": "Retry", "content": "Content"}, headers=auth_headers)
+
+        jobs.run_pending(db_session)
+        job = db_session.scalars(select(models.NoteJob)).one()
+        assert (job.status, job.attempts) == ("pending", 1)
+        assert "boom" in job.last_error
+        assert jobs.run_pending(db_session) == 0
+
+        job.run_after = job.run_after - timedelta(hours=1)
+        db_session.commit()
+        jobs.run_pending(db_session)
+        db_session.refresh(job)
+        assert (job.status, job.attempts) == ("failed", 2)
+
+class TestCompression:
+    def _seed(self, db_session: Session, owner_id: int, count: int = 20):
+        db_session.add_all(models.Note(title=f"Note {i}", content="lorem ipsum " * 50, owner_id=owner_id) for i in range(count))
+        db_session.commit()
+
+    def test_large_response_is_gzipped(self, test_client: TestClient, test_user: models.User, auth_headers: dict, db_session: Session):
+        self._seed(db_session, test_user.id)
+
+        response = test_client.get("/notes/", headers={**auth_headers, "Accept-Encoding": "gzip"})
+
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert "Accept-Encoding" in response.headers["Vary"]
+        assert int(response.headers["Content-Length"]) < len(response.content)
+        assert len(response.json()) == 20
+
+    def test_small_response_is_not_compressed(self, test_client: TestClient, auth_headers: dict):
+        response = test_client.get("/notes/", headers={**auth_headers, "Accept-Encoding": "gzip"})
+
+        assert "Content-Encoding" not in response.headers
+        assert response.json() == []
+
+    def test_unchanged_response_reuses_compressed_bytes(self, test_client: TestClient, test_user: models.User, auth_headers: dict, db_session: Session):
+        self._seed(db_session, test_user.id)
+        headers = {**auth_headers, "Accept-Encoding": "gzip"}
+
+        first = test_client.get("/notes/", headers=headers)
+        second = test_client.get("/notes/", headers=headers)
+
+        assert first.content == second.content
+        assert compression.compressed_cache.stats()["hits"] == 1
+
+    def test_route_level_zero_disables_encoding(self, test_client: TestClient, test_user: models.User, auth_headers: dict, db_session: Session, monkeypatch):
+        self._seed(db_session, test_user.id)
+        monkeypatch.setattr(compression, "ROUTE_LEVELS", {"/notes/": {"gzip": 0}})
+
+        response = test_client.get("/notes/", headers={**auth_headers, "Accept-Encoding": "gzip"})
+
+        assert "Content-Encoding" not in response.headers
+
+    def test_negotiate_respects_quality_values(self):
+        levels = {"gzip": 6, "br": 4, "zstd": 3}
+        assert compression.negotiate("gzip;q=0.5, identity", levels) == "gzip"
+        assert compression.negotiate("gzip;q=0", levels) is None
+        assert compression.negotiate("deflate", levels) is None
+
+# Statements each endpoint may run for a user with many notes. Raising a budget
+# should come with a reason; an N+1 shows up here as a count that grows with the data.
+QUERY_BUDGETS = [
+    ("GET", "/notes/", None, 1),
+    ("GET", "/notes/?view=summary", None, 1),
+    ("GET", "/notes/{note_id}", None, 1),
+    ("GET", "/notes/search?q=budget", None, 1),
+    ("GET", "/notes/changes", None, 2),
+    ("GET", "/notes/export", None, 1),
+    # Writes that change content also queue one batch of jobs.
+    ("POST", "/notes/", {"title": "New", "content": "Content"}, 3),
+    ("POST", "/notes/bulk", [{"title": f"Bulk {i}", "content": "Content"} for i in range(20)], 2),
+    # Lock the old version, update, read the revision number, store the delta, queue jobs.
+    ("PUT", "/notes/{note_id}", {"title": "Updated", "content": "Changed"}, 5),
+    ("DELETE", "/notes/{note_id}", None, 3),
+]
+
+class TestQueryBudgets:
+    @pytest.mark.parametrize("method,path,body,budget", QUERY_BUDGETS)
+    def test_endpoint_query_budget(self, method: str, path: str, body, budget: int, test_client: TestClient, test_user: models.User, db_session: Session, query_budget):
+        db_session.add_all(models.Note(title=f"Note {i}", content="budget", owner_id=test_user.id) for i in range(25))
+        db_session.commit()
+        note_id = db_session.scalars(select(models.Note.id)).first()
+        headers = {"Authorization": f"Bearer {create_access_token(data={'sub': test_user.email, 'uid': test_user.id})}"}
+        # Steady state: the caller's id was checked by an earlier request.
+        auth.known_user_ids.set(test_user.id, True)
+
+        with query_budget(budget):
+            response = test_client.request(method, path.format(note_id=note_id), json=body, headers=headers)
+
+        assert response.status_code < 300
+
+    def test_query_counter_flags_repeated_statements(self, test_user: models.User, db_session: Session):
+        db_session.add_all(models.Note(title=f"Note {i}", content="Content", owner_id=test_user.id) for i in range(3))
+        db_session.commit()
+        ids = db_session.scalars(select(models.Note.id)).all()
+
+        with QueryCounter() as counter:
+            for note_id in ids:
+                db_session.execute(select(models.Note.title).where(models.Note.id == note_id)).one()
+
+        assert counter.count == 3
+        assert list(counter.repeated().values()) == [3]
+        assert "possible N+1, 3x" in counter.report()
+
+    def test_lazy_relationship_load_raises(self, test_user: models.User, db_session: Session):
+        note = models.Note(title="Lazy", content="Content", owner_id=test_user.id)
+        db_session.add(note)
+        db_session.commit()
+        note_id = note.id
+        db_session.expunge_all()
+        note = db_session.get(models.Note, note_id)
+
+        with pytest.raises(exc.InvalidRequestError):
+            note.owner